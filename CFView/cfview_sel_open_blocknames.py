@@ -29,9 +29,29 @@ Script to import a computation using selective open by using block names
 Author: Thanos Poulos
 '''
 
+import difflib
+import fnmatch
+import hashlib
+import json
 import os
+import re
+import shutil
 import subprocess
 import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# h5py is only needed to read the block names directly from the .cgns file
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 #------------------ INPUT DATA ------------------------------------------------
 
@@ -40,6 +60,12 @@ import sys
 igg_path = "DemoCase8.igg"
 
 # List containing the block names that you want to import
+# Each item can be:
+#   - a full block name, e.g. "row_2_flux_1_Main_Blade_skin"
+#   - a glob pattern, e.g. "row_2_flux_1_Main_Blade_*" or "*_shroudgap?"
+#   - a regular expression starting with re:, e.g. "re:row_[12]_flux_1_.*_inlet"
+#   - a dictionary selecting by prefix, e.g. {"row": 2, "flux": 1, "blade": "Main_Blade"}
+#     (all keys are optional)
 block_names = ["row_2_flux_1_Main_Blade_downStream",
                "row_2_flux_1_Main_Blade_outlet",
                "row_2_flux_1_Main_Blade_upStream",
@@ -50,20 +76,278 @@ block_names = ["row_2_flux_1_Main_Blade_downStream",
                "row_2_flux_1_Main_Blade_shroudgap1",
                "row_2_flux_1_Main_Blade_shroudgap2"]
 
+# Blocks can also be selected by region. Each region gives a row number, the
+# domain types to load and the meridional flow paths (flux_N in the AutoGrid
+# names, e.g. core and bypass). "flow_paths" is either a number N (flux_1 to
+# flux_N) or a list of flow path numbers, flux_1 by default:
+#   "blade_passage": skin, up and down blocks around the blade
+#   "tip_gap":       shroud and hub gap blocks
+#   "inlet":         upStream and inlet blocks
+#   "outlet":        outlet and downStream blocks
+# e.g. regions = [{"row": 2, "domains": ["blade_passage", "tip_gap"], "flow_paths": 1}]
+# The blocks of the regions are added to block_names
+regions = []
+
+# Estimate of the memory used by CFView per loaded cell (bytes) and memory
+# available on the node (GB). The estimate needs the block dimensions, which
+# are known when the names come from the .cgns file. Set to 0 to not check
+cfview_bytes_per_cell = 1000
+node_memory_gb = 0
+
 # If you just want to open the project and not do anything else, leave this empty
 # If it is not empty, it should point to a CFView macro which will copy 
 # and will only change the FileOpenProjectSelection command
 macro = ''
 
-### There is additional user input needed on line 259
-# The command variable needs to be changed
+# Persistent cache of the block names of each mesh. When the mesh has not
+# changed, the names are taken from the cache and IGG is not launched
+use_block_cache = True
+block_cache_file = os.path.join(os.path.expanduser("~"), ".numeca", "igg_block_names_cache.json")
+
+# Read the block names directly from the .cgns file next to the .igg file
+# (same name, .cgns extension). This needs h5py but no IGG session and no
+# licence. IGG is used if the file cannot be read.
+use_native_reader = True
+
+# Batch mode: list of .run files post-processed with the macro above (which
+# is then required). All runs must use the mesh of igg_path. Each run gets its
+# own directory in batch_dir with the macro, the CFView log and its exports.
+# Leave empty to open a single computation
+batch_run_files = []
+batch_dir = "cfview_batch"
+# Maximum number of CFView sessions running at the same time (licences)
+cfview_licences = 4
+# Keep the files exported by the macro of each batch run. A run is sent to
+# CFView again only if the macro, the block selection or its result files changed
+# Only the batch and pipeline modes use this cache, a single computation is
+# always opened in CFView. A run that exports nothing in its job directory
+# (e.g. a macro writing to absolute paths) is not cached
+use_results_cache = True
+results_cache_dir = os.path.join(os.path.expanduser("~"), ".numeca", "cfview_results_cache")
+
+# Pipeline mode: list of projects (mesh, run file) post-processed with the
+# macro above, each in its own directory in batch_dir. The block names of the
+# next project are extracted (IGG stage) while CFView runs the previous ones.
+# At most pipeline_queue_size projects wait between the two stages.
+# e.g. pipeline_projects = [("DemoCase8.igg", "DemoCase_8_000_FMMP.run")]
+# Leave empty to use igg_path only
+pipeline_projects = []
+pipeline_queue_size = 2
+
+### There is additional user input needed in the USER INPUT section at the start of the Main Program
+# The command_template variable needs to be changed
 
 #------------------ END INPUT DATA --------------------------------------------
 
 # Functions
 #----------
 
-def igg_get_block_names(project_path, delete_python_script):
+def file_hash(file_path):
+    '''
+    Function that returns the sha1 hash of a file, read in chunks
+    '''
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        chunk = f.read(1024*1024)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(1024*1024)
+    return h.hexdigest()
+
+
+def load_block_cache():
+    '''
+    Function that reads the block name cache file
+    
+    Output: dictionary with the absolute .igg path as key. An empty
+    dictionary is returned if the cache does not exist or is unreadable
+    '''
+    try:
+        with open(block_cache_file, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_block_cache(cache):
+    '''
+    Function that writes the block name cache file
+    
+    The file is written to a temporary name first and then renamed, so that
+    a run that is interrupted does not leave a broken cache behind
+    '''
+    cache_dir = os.path.dirname(block_cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = "%s.%s.tmp" % (block_cache_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f)
+    os.rename(tmp_file, block_cache_file)
+
+
+def get_cached_block_names(project_path):
+    '''
+    Function that looks for the block names of a mesh in the cache
+    
+    An entry is valid if the size and modification time of the .igg file
+    are unchanged. If only the modification time differs (e.g. copied or
+    touched file), the sha1 hash of the file decides. An entry read from the
+    .cgns file is also only valid if the size and modification time of the
+    .cgns file are unchanged.
+    
+    Input: Full absolute project path pointing to an IGG file
+    
+    Output: list with the block names, list with the block dimensions
+    (None if unknown) and whether the names come from the .cgns file, or
+    None if there is no valid entry
+    '''
+    cache = load_block_cache()
+    entry = cache.get(project_path)
+    if entry is None:
+        return None
+    
+    cgns = entry.get("cgns")
+    if cgns is not None:
+        cgns_path = cgns_file(project_path)
+        if not os.path.isfile(cgns_path):
+            return None
+        cgns_stat = os.stat(cgns_path)
+        if cgns != [cgns_stat.st_size, cgns_stat.st_mtime]:
+            return None
+    
+    stat = os.stat(project_path)
+    if entry["size"] != stat.st_size:
+        return None
+    if entry["mtime"] != stat.st_mtime:
+        if entry["sha1"] != file_hash(project_path):
+            return None
+        entry["mtime"] = stat.st_mtime
+        save_block_cache(cache)
+    
+    return entry["blocks"], entry.get("dims"), cgns is not None
+
+
+def store_block_names(project_path, block_list, block_dims=None, from_cgns=False):
+    '''
+    Function that adds the block names of a mesh to the cache
+    
+    Input: Full absolute project path pointing to an IGG file, the list
+    of the block names in the correct order, optionally the list of the
+    block dimensions (number of vertices in each direction) and whether the
+    names were read from the .cgns file (its size and modification time are
+    then stored with the entry)
+    '''
+    stat = os.stat(project_path)
+    cache = load_block_cache()
+    cache[project_path] = {"size": stat.st_size,
+                           "mtime": stat.st_mtime,
+                           "sha1": file_hash(project_path),
+                           "blocks": block_list,
+                           "dims": block_dims}
+    if from_cgns:
+        cgns_stat = os.stat(cgns_file(project_path))
+        cache[project_path]["cgns"] = [cgns_stat.st_size, cgns_stat.st_mtime]
+    save_block_cache(cache)
+
+
+def cgns_file(project_path):
+    '''
+    Function that returns the companion .cgns file of an IGG file
+    '''
+    return os.path.splitext(project_path)[0] + ".cgns"
+
+
+def cgns_node_label(node):
+    '''
+    Function that returns the CGNS label (e.g. Zone_t) of an HDF5 node
+    '''
+    label = node.attrs.get("label", b"")
+    if hasattr(label, "tobytes"):
+        label = label.tobytes()
+    if isinstance(label, bytes):
+        label = label.decode("ascii", "ignore")
+    return label.strip("\x00 ")
+
+
+def cgns_children_in_order(group):
+    '''
+    Function that returns the names of the children of an HDF5 group in
+    creation order, which is the order the blocks were written in.
+    
+    Output: list of names or None if the creation order is not tracked
+    '''
+    names = []
+    
+    def collect(name):
+        names.append(name)
+    
+    try:
+        group.id.links.iterate(collect, idx_type=h5py.h5.INDEX_CRT_ORDER)
+    except Exception:
+        # The file was written without tracking the creation order
+        return None
+    return [n.decode("ascii") if isinstance(n, bytes) else n for n in names]
+
+
+def read_cgns_block_list(project_path):
+    '''
+    Function that reads the ordered block list of a mesh from the companion
+    .cgns file (HDF5) written next to the .igg file, without launching IGG.
+    
+    The zones of the first CGNS base are written in the IGG block order, so
+    the position of a zone gives the block index.
+    
+    Input: Full absolute project path pointing to an IGG file
+    
+    Output: list of (index, name, dimensions) tuples where the dimensions are
+    the number of vertices (ni, nj, nk). None is returned if the file does not
+    exist, is not HDF5, the zone order cannot be recovered or a zone name may
+    have been truncated to the CGNS name length (the IGG name is then unknown).
+    '''
+    cgns_path = cgns_file(project_path)
+    if h5py is None or not os.path.isfile(cgns_path) or not h5py.is_hdf5(cgns_path):
+        return None
+    
+    with h5py.File(cgns_path, "r") as cgns:
+        bases = [cgns[n] for n in cgns if isinstance(cgns[n], h5py.Group)
+                 and cgns_node_label(cgns[n]) == "CGNSBase_t"]
+        if not bases:
+            return None
+        zone_names = cgns_children_in_order(bases[0])
+        if zone_names is None:
+            return None
+        
+        block_list = []
+        for name in zone_names:
+            zone = bases[0][name]
+            if not isinstance(zone, h5py.Group) or cgns_node_label(zone) != "Zone_t":
+                continue
+            if len(name) >= CGNS_NAME_LENGTH:
+                return None
+            dims = None
+            if " data" in zone:
+                dims = tuple(int(x) for x in zone[" data"][()][0])
+            block_list.append((len(block_list) + 1, name, dims))
+    
+    return block_list
+
+
+# CGNS node names have at most 32 characters, longer IGG block names are truncated
+CGNS_NAME_LENGTH = 32
+
+
+def write_block_names_file(block_names, work_dir=None):
+    '''
+    Function that writes the block names in blf.dat in the work directory
+    (current directory by default), one name per line, the format written
+    by the IGG python script
+    '''
+    with open(os.path.join(work_dir or os.getcwd(), "blf.dat"), 'w') as temp:
+        for name in block_names:
+            temp.write(name + "\n")
+
+
+def igg_get_block_names(project_path, delete_python_script, work_dir=None, selection=None):
     '''
     Function that gets the block names from igg_get_block_names
     
@@ -71,19 +355,59 @@ def igg_get_block_names(project_path, delete_python_script):
     in the correct order (one name per line). It also creates a python
     script. There is a prompt to delete the file or not in the end. 
     
+    If the block name cache is used and contains the mesh, IGG is not
+    launched and the dat file is written from the cache. Otherwise, the
+    names are read from the .cgns file if possible before falling back to IGG.
+    The names of the .cgns file are not used if some items of the block
+    selection (see INPUT DATA) do not match any of them, as the .cgns names
+    may differ from the IGG names.
+    
+    The temporary files are written in the work directory (current
+    directory by default).
+    
     Input: Full absolute project path pointing to an IGG file
     
-    Output: Temporary dat file containing block names
+    Output: Temporary dat file containing block names. The function returns
+    the list of the block dimensions if they are known, None otherwise
     '''
-    # Get current directory
-    cdir = os.getcwd()
+    # Get the work directory
+    cdir = os.path.abspath(work_dir or os.getcwd())
+    igg_script = os.path.join(cdir, "igg_script.py")
+    project_path = os.path.abspath(project_path)
+    
+    if use_block_cache:
+        cached = get_cached_block_names(project_path)
+        if cached is not None:
+            block_list, block_dims, from_cgns = cached
+            if not (from_cgns and selection and resolve_block_selection(selection, block_list)[1]):
+                write_block_names_file(block_list, cdir)
+                print(">>> The block names were found in the cache, IGG is not launched ")
+                return block_dims
+    
+    if use_native_reader:
+        cgns_blocks = read_cgns_block_list(project_path)
+        if cgns_blocks and selection:
+            if resolve_block_selection(selection, [name for index, name, dims in cgns_blocks])[1]:
+                print(">>> The block selection does not match the names of the .cgns file, IGG is used ")
+                cgns_blocks = None
+        if cgns_blocks:
+            block_list = [name for index, name, dims in cgns_blocks]
+            block_dims = [dims for index, name, dims in cgns_blocks]
+            if None in block_dims:
+                block_dims = None
+            write_block_names_file(block_list, cdir)
+            print(">>> The block names were read from the .cgns file, IGG is not launched ")
+            if use_block_cache:
+                store_block_names(project_path, block_list, block_dims, True)
+            return block_dims
+    
     # temp variables
     temporary_file = "outfile = " + "'" + cdir + "/" + "blf.dat" + "'"
     path = "path = " + "'" + project_path + "'"
     
     # Create IGG python script
     print(">>> Creating IGG python script <<<")
-    with open("igg_script.py", 'w') as iggpy:
+    with open(igg_script, 'w') as iggpy:
         iggpy.write("script_version(2.2)\n")
         iggpy.write("import os\n")
         iggpy.write(path)
@@ -108,40 +432,263 @@ def igg_get_block_names(project_path, delete_python_script):
     
     print(">>> Running IGG puthon script ")
     
-    subprocess.call(["igg111", "-batch", "-script", "igg_script.py"])
+    # A block name file left by another mesh must not be taken for the output of this session
+    block_names_file = os.path.join(cdir, "blf.dat")
+    if os.path.isfile(block_names_file):
+        os.remove(block_names_file)
+    
+    try:
+        exit_code = subprocess.call(["igg111", "-batch", "-script", igg_script], cwd=cdir)
+    except OSError as e:
+        print("*** Error: IGG could not be started: %s ***" % e)
+        exit_code = -1
+    if exit_code != 0 or not os.path.isfile(block_names_file):
+        print("*** Error: IGG failed (exit code %s), the block names were not written ***" % exit_code)
+        print("*** The program will now exit ***")
+        sys.exit()
     
     print(">>> IGG python script finished successfully ")
     
+    if use_block_cache:
+        with open(os.path.join(cdir, "blf.dat"), 'r') as f:
+            store_block_names(project_path, f.read().splitlines())
+        print(">>> The block names have been added to the cache ")
+    
     if delete_python_script == "y":
-        os.remove("igg_script.py")
+        os.remove(igg_script)
         print(">>> The IGG python script has been deleted ")
+    
+    return None
+
+
+# Block name endings of each domain type (AutoGrid naming)
+domain_block_names = {
+    "blade_passage": ["skin", "up", "down"],
+    "tip_gap": ["shroudgap\\d*", "hubgap\\d*"],
+    "inlet": ["upStream", "inlet"],
+    "outlet": ["outlet", "downStream"],
+    }
+
+
+def regions_to_selection(regions):
+    '''
+    Function that translates the regions (see INPUT DATA) into regular
+    expressions understood by get_block_indices_from_names
+    
+    Input: list of region dictionaries with the row, the domain types and the
+    flow paths (number of flow paths or list of flow path numbers)
+    
+    Output: list of "re:" block selection items
+    '''
+    selection = []
+    for region in regions:
+        flow_paths = region.get("flow_paths", 1)
+        if isinstance(flow_paths, (list, tuple)):
+            fluxes = "|".join(str(int(n)) for n in flow_paths)
+        else:
+            fluxes = "|".join(str(n) for n in range(1, int(flow_paths) + 1))
+        for domain in region["domains"]:
+            if domain not in domain_block_names:
+                print("*** Error: Unknown domain type %s, use one of %s ***"
+                      % (domain, ", ".join(sorted(domain_block_names))))
+                print("*** The program will now exit ***")
+                sys.exit()
+            endings = "|".join(domain_block_names[domain])
+            selection.append("re:row_%s_flux_(?:%s)_.*_(?:%s)" % (region["row"], fluxes, endings))
+    return selection
+
+
+def block_cells(dims):
+    '''
+    Function that returns the number of cells of a block from its number of
+    vertices in each direction
+    '''
+    nb_cells = 1
+    for n in dims:
+        nb_cells *= max(n - 1, 1)
+    return nb_cells
 
 
-def get_block_indices_from_names(input_list,delete_block_names_file):
+def check_selection_memory(index_list, block_dims):
+    '''
+    Function that estimates the number of cells and the memory CFView needs
+    to load the selected blocks, before CFView is launched
+    
+    If the estimate is larger than node_memory_gb, the user is asked whether
+    to continue.
+    
+    Input: list of the selected block indices (starting from 1), list of the
+    dimensions of all blocks (number of vertices) or None if unknown
+    
+    Output: None
+    '''
+    if block_dims is None:
+        print(">>> The block dimensions are unknown, the memory of the selection is not estimated ")
+        return
+    
+    cells = sum(block_cells(block_dims[index - 1]) for index in index_list)
+    total_cells = sum(block_cells(dims) for dims in block_dims)
+    memory_gb = cells * float(cfview_bytes_per_cell) / 1024**3
+    
+    print(">>> The selection has %s cells (%.1f%% of the mesh), about %.2f GB in CFView "
+          % (cells, 100.0 * cells / max(total_cells, 1), memory_gb))
+    
+    if node_memory_gb and memory_gb > node_memory_gb:
+        print("*** Warning: The selection needs more than the %s GB of the node ***" % node_memory_gb)
+        if raw_input("<> Do you want to continue? [y,n]: ") != "y":
+            print("*** The program will now exit ***")
+            sys.exit()
+
+
+def build_block_index(block_list):
+    '''
+    Function that creates the name -> index (starting from 1) dictionary of the
+    blocks. If a name appears twice, the first block is kept.
+    '''
+    block_index = {}
+    for i, name in enumerate(block_list):
+        if name not in block_index:
+            block_index[name] = i + 1
+    return block_index
+
+
+def selection_to_regex(item):
+    '''
+    Function that translates an item of the block selection into a regular
+    expression. Full block names return None as they are looked up directly.
+    
+    Input: block name, glob pattern, "re:" regular expression or dictionary
+    with the row, flux and blade of the blocks
+    
+    Output: regular expression string or None
+    '''
+    if isinstance(item, dict):
+        row = item.get("row", r"\d+")
+        flux = item.get("flux", r"\d+")
+        blade = item.get("blade")
+        prefix = r"row_%s_flux_%s_" % (row, flux)
+        if blade is not None:
+            prefix += re.escape(blade) + "_"
+        return prefix + ".*"
+    if item.startswith("re:"):
+        return item[3:]
+    if any(c in item for c in "*?["):
+        return fnmatch.translate(item)
+    return None
+
+
+def resolve_block_selection(input_list, block_list):
+    '''
+    Function that finds the indices of the selected blocks
+    
+    Full names are found through a name -> index dictionary built once. Each
+    pattern is first compiled on its own, so that the invalid ones are
+    reported. The patterns without groups are then compiled into a single
+    regular expression so that the block list is only scanned once, whatever
+    the number of patterns. The patterns with groups (e.g. backreferences)
+    are matched on their own, as the combined expression renumbers the groups.
+    
+    Input: block selection (see INPUT DATA) and list of the block names
+    
+    Output: sorted list of unique block indices, list of the items that did
+    not select any block, list of (item, error) of the invalid patterns
+    '''
+    block_index = build_block_index(block_list)
+    
+    selected = set()
+    missing = []
+    invalid = []
+    patterns = []
+    for item in input_list:
+        regex = selection_to_regex(item)
+        if regex is None:
+            if item in block_index:
+                selected.add(block_index[item])
+            else:
+                missing.append(item)
+            continue
+        try:
+            re.compile(regex)
+            single = re.compile("(?:%s)\\Z" % regex)
+        except re.error as e:
+            invalid.append((item, str(e)))
+            continue
+        if single.groups:
+            matches = [index for name, index in block_index.items() if single.match(name)]
+            if matches:
+                selected.update(matches)
+            else:
+                missing.append(item)
+        else:
+            patterns.append((item, regex))
+    
+    if patterns:
+        # One named group per pattern tells which pattern matched a name
+        combined = re.compile("(?:%s)\\Z" % "|".join("(?P<p%s>%s)" % (i, regex)
+                                                    for i, (item, regex) in enumerate(patterns)))
+        matched = set()
+        for name, index in block_index.items():
+            m = combined.match(name)
+            if m is not None:
+                selected.add(index)
+                matched.add(m.lastgroup)
+        # A name is only reported under the first pattern that matches it,
+        # so check the patterns that seem unused on their own
+        for i, (item, regex) in enumerate(patterns):
+            if "p%s" % i not in matched:
+                single = re.compile("(?:%s)\\Z" % regex)
+                if not any(single.match(name) for name in block_index):
+                    missing.append(item)
+    
+    return sorted(selected), missing, invalid
+
+
+def get_block_indices_from_names(input_list,delete_block_names_file, work_dir=None):
     '''
     Function that reads the file with the block names and puts them into a list.
-    The indices are accessed through the list.
+    The indices are found through a name -> index dictionary and the patterns
+    of the selection (see INPUT DATA).
     
     The file name needs to be blf.dat (of course this is not optimal and it can
-    be changed in the future
+    be changed in the future), in the work directory (current directory by default)
     
     Also,it creates the command to pass to the run_cfview function
     FileOpenProjectSelection
     
+    If an item of the selection does not match any block, all such items are
+    reported with the closest block names and the program exits.
+    
     Input: input list with the require block names
     
-    Output: string with the block indices to be used in the command
+    Output: list of the selected block indices, string with the block indices
+    to be used in the command
     '''
     
-    with open("blf.dat", 'r') as f:
+    block_names_file = os.path.join(work_dir or os.getcwd(), "blf.dat")
+    with open(block_names_file, 'r') as f:
         block_list = f.read().splitlines()
     
-    index_list = []
-    for item in input_list:
-        index_list.append(block_list.index(item)+1)
+    index_list, missing, invalid = resolve_block_selection(input_list, block_list)
     
-    # sort the list
-    index_list.sort()
+    if invalid:
+        print("*** Error: %s regular expression(s) of the block selection are invalid ***" % len(invalid))
+        for item, error in invalid:
+            print("***   %s (%s)" % (item, error))
+        print("*** The program will now exit ***")
+        sys.exit()
+    
+    if missing:
+        print("*** Error: %s item(s) of the block selection do not match any block ***" % len(missing))
+        for item in missing:
+            close = []
+            if not isinstance(item, dict):
+                close = difflib.get_close_matches(item, block_list, 3)
+            if close:
+                print("***   %s (closest: %s)" % (item, ", ".join(close)))
+            else:
+                print("***   %s" % (item,))
+        print("*** The program will now exit ***")
+        sys.exit()
     
     # Create a string from the index list to be inpu in the command
     indices = ' '.join(str(x) for x in index_list)
@@ -153,10 +700,362 @@ def get_block_indices_from_names(input_list,delete_block_names_file):
     
     # Clean the auxiliary block name file if needed
     if delete_block_names_file == "y":
-        os.remove("blf.dat")
+        os.remove(block_names_file)
         print(">>> The auxiliary block name file has been deleted ")
     
-    return indices
+    return index_list, indices
+
+
+def write_cfview_macro(command, macro, macro_file):
+    '''
+    Function that writes a CFView macro from a template macro
+    
+    The first line of the template (CFViewBackward(912)) is kept, the
+    selective open command is added after it and any FileOpenProjectSelection
+    of the template is removed.
+    
+    Input: selective open command, template macro path, macro to write
+    
+    Output: None
+    '''
+    with open(macro, 'r') as infile, open(macro_file, "w") as outfile:
+        # Read and write the first line (CFViewBackward(912))
+        outfile.write(infile.readline())
+        outfile.write("\n")
+        outfile.write(command)
+        outfile.write("\n")
+        
+        # Read and write the rest of the file
+        for line in infile:
+            # Check if the FileOpenProjectSelection already exists
+            if line.startswith("FileOpenProjectSelection"):
+                continue
+            
+            outfile.write(line)
+
+
+def results_cache_key(job):
+    '''
+    Function that returns the results cache key of a batch run
+    
+    The key is the sha1 of the macro text (which contains the selective open
+    command, so the block selection) and of the size and modification time of
+    the run file and of the result files next to it (same name, any extension).
+    
+    Input: job dictionary (see run_cfview_batch)
+    
+    Output: key string
+    '''
+    h = hashlib.sha1()
+    with open(job["macro"], 'rb') as f:
+        h.update(f.read())
+    run_dir = os.path.dirname(job["run"])
+    for name in sorted(os.listdir(run_dir)):
+        if os.path.splitext(name)[0] == job["name"]:
+            stat = os.stat(os.path.join(run_dir, name))
+            h.update(("%s %s %s\n" % (name, stat.st_size, stat.st_mtime)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def job_files(job_dir):
+    '''
+    Function that returns the modification time of the files of a job
+    directory, leaving out the macro and the log
+    '''
+    files = {}
+    for name in os.listdir(job_dir):
+        path = os.path.join(job_dir, name)
+        if name not in ("cfview_script.py", "cfview.log") and os.path.isfile(path):
+            files[name] = os.path.getmtime(path)
+    return files
+
+
+def store_results(key, job_dir, names):
+    '''
+    Function that copies the files exported by a run into the results cache
+    
+    The files are copied to a temporary directory which is then renamed, so
+    that an interrupted copy is never taken as a valid entry. Nothing is
+    stored if the run did not export any file, so that the run is not skipped
+    the next time.
+    '''
+    entry = os.path.join(results_cache_dir, key)
+    if not names or os.path.isdir(entry):
+        return
+    tmp_entry = "%s.%s.tmp" % (entry, os.getpid())
+    os.makedirs(tmp_entry)
+    for name in names:
+        shutil.copy2(os.path.join(job_dir, name), tmp_entry)
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # Another session stored the same results in the meantime
+        shutil.rmtree(tmp_entry)
+
+
+def restore_results(key, job_dir):
+    '''
+    Function that copies the cached exports of a run into its job directory
+    
+    Output: True if the cache had an entry for the key
+    '''
+    entry = os.path.join(results_cache_dir, key)
+    if not os.path.isdir(entry):
+        return False
+    for name in os.listdir(entry):
+        shutil.copy2(os.path.join(entry, name), job_dir)
+    return True
+
+
+def run_cfview_job(job):
+    '''
+    Function that runs one CFView batch session of the batch mode
+    
+    The session is run in the job directory so that the files exported by
+    the macro of different runs do not overwrite each other. With the results
+    cache, unchanged runs get their exports back from the cache instead.
+    
+    Input: dictionary with the run file, job directory and macro file
+    
+    Output: the job dictionary with the exit code, log file, wall time and
+    whether the results came from the cache
+    '''
+    job["log"] = os.path.join(job["dir"], "cfview.log")
+    job["cached"] = False
+    start = time.time()
+    
+    key = None
+    if use_results_cache:
+        key = results_cache_key(job)
+        if restore_results(key, job["dir"]):
+            with open(job["log"], "w") as log:
+                log.write("Results taken from the cache entry %s\n" % key)
+            job["exit_code"] = 0
+            job["cached"] = True
+            job["wall_time"] = time.time() - start
+            print(">>> %s taken from the results cache " % job["name"])
+            return job
+    
+    before = job_files(job["dir"])
+    with open(job["log"], "w") as log:
+        try:
+            job["exit_code"] = subprocess.call(["cfview111", "-macro", job["macro"], "-batch", "-print"],
+                                               cwd=job["dir"], stdout=log, stderr=subprocess.STDOUT)
+        except OSError as e:
+            log.write("Could not start CFView: %s\n" % e)
+            job["exit_code"] = -1
+    job["wall_time"] = time.time() - start
+    
+    if key is not None and job["exit_code"] == 0:
+        exported = [name for name, mtime in job_files(job["dir"]).items()
+                    if before.get(name) != mtime]
+        if exported:
+            store_results(key, job["dir"], exported)
+        else:
+            print("*** Warning: %s did not export any file in %s, it is not cached ***" % (job["name"], job["dir"]))
+    print(">>> %s finished with exit code %s in %.1f s " % (job["name"], job["exit_code"], job["wall_time"]))
+    return job
+
+
+def run_cfview_batch(run_files, command_template, nb_blocks, indices, macro, licences):
+    '''
+    Function that post-processes several computations with the same macro
+    
+    A macro is written for each run from the template macro and the CFView
+    batch sessions are run in a pool of at most "licences" sessions. A summary
+    with the exit code, wall time, use of the results cache and log of each
+    run is written in batch_dir.
+    
+    Input: list of .run files, selective open command template, number of
+    blocks and block indices, template macro path, maximum number of sessions
+    
+    Output: list of job dictionaries (see run_cfview_job)
+    '''
+    if not os.path.isfile(macro):
+        print("*** Error: The batch mode needs an existing CFView macro ***")
+        print("*** The program will now exit ***")
+        sys.exit()
+    
+    jobs = []
+    for index, run_file in enumerate(run_files):
+        job = make_cfview_job(run_file, index)
+        if job is None:
+            continue
+        command = command_template % {"run": job["run"], "nb_blocks": nb_blocks, "indices": indices}
+        write_cfview_macro(command, macro, job["macro"])
+        jobs.append(job)
+    
+    if use_results_cache and not os.path.isdir(results_cache_dir):
+        os.makedirs(results_cache_dir)
+    
+    print(">>> Running %s CFView sessions, %s at a time " % (len(jobs), licences))
+    start = time.time()
+    pool = ThreadPool(max(1, min(licences, len(jobs))))
+    try:
+        jobs = pool.map(run_cfview_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    
+    write_batch_summary(jobs, start)
+    
+    return jobs
+
+
+def make_cfview_job(run_file, index):
+    '''
+    Function that creates the job directory of a run in batch_dir
+    
+    The directory name starts with the position of the run in the batch, so
+    that runs with the same file name in different projects do not share a
+    directory.
+    
+    Input: .run file, position of the run in the batch
+    
+    Output: job dictionary with the name, run file, job directory and macro
+    file, or None if the run file does not exist
+    '''
+    run_file = os.path.abspath(run_file)
+    if not os.path.isfile(run_file):
+        print("*** Warning: %s does not exist and is skipped ***" % run_file)
+        return None
+    name = os.path.splitext(os.path.basename(run_file))[0]
+    job_dir = os.path.abspath(os.path.join(batch_dir, "%03d_%s" % (index, name)))
+    if not os.path.isdir(job_dir):
+        os.makedirs(job_dir)
+    return {"name": name, "run": run_file, "dir": job_dir,
+            "macro": os.path.join(job_dir, "cfview_script.py")}
+
+
+def write_batch_summary(jobs, start):
+    '''
+    Function that writes the summary of the batch and pipeline modes in
+    batch_dir and reports the failed runs
+    
+    Input: list of finished job dictionaries, start time of the batch
+    '''
+    with open(os.path.join(batch_dir, "cfview_batch_summary.dat"), "w") as summary:
+        summary.write("# name exit_code wall_time[s] cached log\n")
+        for job in jobs:
+            summary.write("%s %s %.1f %s %s\n" % (job["name"], job["exit_code"], job["wall_time"],
+                                                 job["cached"], job["log"]))
+    
+    # Runs of different projects can have the same name, the run file is reported
+    failed = [job["run"] for job in jobs if job["exit_code"] != 0]
+    print(">>> The batch took %.1f s, %s of %s runs failed " % (time.time() - start, len(failed), len(jobs)))
+    for name in failed:
+        print("*** Failed: %s ***" % name)
+
+
+def igg_stage(projects, selection, command_template, macro, jobs_queue):
+    '''
+    Function that runs the IGG stage of the pipeline mode (block names and
+    indices, CFView macro) for each project and puts the jobs in the queue
+    
+    The stage runs in its own thread. The queue is bounded, so the stage waits
+    when CFView falls behind. A project whose IGG stage fails for any reason
+    is put in the queue as a failed job and the next project is handled.
+    None is always put in the queue at the end, even if the stage stops
+    unexpectedly, so that the CFView stage never waits forever.
+    '''
+    try:
+        for index, (igg_file, run_file) in enumerate(projects):
+            job = None
+            try:
+                job = make_cfview_job(run_file, index)
+                if job is None:
+                    continue
+                if not os.path.isfile(igg_file):
+                    raise IOError("The mesh file %s does not exist" % igg_file)
+                igg_get_block_names(igg_file, "y", job["dir"], selection)
+                index_list, indices = get_block_indices_from_names(selection, "y", job["dir"])
+                command = command_template % {"run": job["run"], "nb_blocks": len(index_list), "indices": indices}
+                write_cfview_macro(command, macro, job["macro"])
+            except (Exception, SystemExit) as e:
+                jobs_queue.put(failed_igg_job(job, run_file, e))
+                continue
+            jobs_queue.put(job)
+    finally:
+        jobs_queue.put(None)
+
+
+def failed_igg_job(job, run_file, error):
+    '''
+    Function that returns the failed job of a project whose IGG stage failed
+    
+    The error is written in the log of the job directory if it exists.
+    
+    Input: job dictionary (None if the job directory could not be created),
+    .run file, error
+    
+    Output: job dictionary marked as failed
+    '''
+    if job is None:
+        job = {"name": os.path.splitext(os.path.basename(run_file))[0], "run": run_file, "dir": None}
+    job.update({"log": None, "exit_code": -1, "wall_time": 0.0, "cached": False, "failed": True})
+    print("*** IGG stage failed for %s: %s ***" % (job["name"], error))
+    if job["dir"] is not None:
+        try:
+            job["log"] = os.path.join(job["dir"], "cfview.log")
+            with open(job["log"], "w") as log:
+                log.write("IGG stage failed: %s\n" % error)
+        except (IOError, OSError):
+            job["log"] = None
+    return job
+
+
+def run_cfview_pipeline(projects, selection, command_template, macro, licences, queue_size):
+    '''
+    Function that post-processes several projects (mesh and run file) with
+    the same macro, overlapping the IGG stage of the next projects with the
+    CFView sessions of the previous ones
+    
+    The IGG stage runs in one thread and hands the jobs to the CFView stage
+    through a queue of at most queue_size jobs. The CFView sessions run in a
+    pool of at most "licences" sessions. Each project uses its own directory
+    in batch_dir for the temporary files.
+    
+    Input: list of (mesh, run file) tuples, block selection, selective open
+    command template, template macro path, maximum number of sessions,
+    maximum number of jobs waiting between the stages
+    
+    Output: list of job dictionaries (see run_cfview_job)
+    '''
+    if not os.path.isfile(macro):
+        print("*** Error: The pipeline mode needs an existing CFView macro ***")
+        print("*** The program will now exit ***")
+        sys.exit()
+    if use_results_cache and not os.path.isdir(results_cache_dir):
+        os.makedirs(results_cache_dir)
+    
+    print(">>> Running the pipeline for %s projects, %s CFView sessions at a time "
+          % (len(projects), licences))
+    start = time.time()
+    jobs_queue = queue.Queue(max(1, queue_size))
+    producer = threading.Thread(target=igg_stage,
+                                args=(projects, selection, command_template, macro, jobs_queue))
+    producer.daemon = True
+    producer.start()
+    
+    pool = ThreadPool(max(1, licences))
+    results = []
+    try:
+        job = jobs_queue.get()
+        while job is not None:
+            if job.get("failed"):
+                results.append(job)
+            else:
+                results.append(pool.apply_async(run_cfview_job, (job,)))
+            job = jobs_queue.get()
+        jobs = [r if isinstance(r, dict) else r.get() for r in results]
+    finally:
+        pool.close()
+        pool.join()
+    producer.join()
+    
+    write_batch_summary(jobs, start)
+    
+    return jobs
 
 
 def run_cfview(command, macro, delete_cfview_file):
@@ -188,21 +1087,7 @@ def run_cfview(command, macro, delete_cfview_file):
             print("*** The program will now exit ***")
             sys.exit()
         
-        with open(macro, 'r') as infile, open("cfview_script.py", "w") as outfile:
-            # Read and write the first line (CFViewBackward(912))
-            outfile.write(infile.readline())
-            outfile.write("\n")
-            outfile.write(command)
-            outfile.write("\n")
-            
-            # Read and write the rest of the file
-            for line in infile:
-                # Check if the FileOpenProjectSelection already exists
-                if line.startswith("FileOpenProjectSelection"):
-                    continue
-                
-                outfile.write(line)
-        
+        write_cfview_macro(command, macro, "cfview_script.py")
         
         print(">>> CFView macro created successfully ")
         print(">>> Running CFView macro ")
@@ -234,33 +1119,50 @@ def run_cfview(command, macro, delete_cfview_file):
 # Main Program
 #--------------
 
-# Check to see if the input exists
-while not os.path.isfile(igg_path):
-    print("*** Error: The mesh file does not exist ***")
-    igg_path = raw_input("<> Please input the mesh file (.igg) full path: ")
-
-# Check to keep auxiliary python file
-delete_python_script = raw_input("<> Do you want the auxiliary IGG python script to be deleted at the end? [y,n]: ")
-
-# Check to keep auxiliary block name file
-delete_block_names_file = raw_input("<> Do you want the auxiliary block name file to be deleted at the end? [y,n]: ")
-
-# Check to keep auxiliary CFView macro
-delete_cfview_file = raw_input("<> Do you want the auxiliary CFView macro to be deleted at the end? [y,n]: ")
-
-# Call the IGG script
-igg_get_block_names(igg_path,delete_python_script)
-
-# Call the index search function
-indices = get_block_indices_from_names(block_names, delete_block_names_file)
-
 ################## USER INPUT ###############################
 # Change the FileOpenProjectSelection command here
-command = "FileOpenProjectSelection('DemoCase_8_000_FMMP.run' ,'blocklist',%s ,%s ,'loadqnt')" % (len(block_names), indices)
+# %(run)s is replaced by the run file (each run of the batch and pipeline modes)
+run_file = 'DemoCase_8_000_FMMP.run'
+command_template = "FileOpenProjectSelection('%(run)s' ,'blocklist',%(nb_blocks)s ,%(indices)s ,'loadqnt')"
 
 ################## END USER INPUT ###########################
 
-# Call the CFView function
-run_cfview(command, macro, delete_cfview_file)
+if pipeline_projects:
+    # Every project is handled in its own directory, the auxiliary files are deleted
+    run_cfview_pipeline(pipeline_projects, block_names + regions_to_selection(regions),
+                        command_template, macro, cfview_licences, pipeline_queue_size)
+else:
+    # Check to see if the input exists
+    while not os.path.isfile(igg_path):
+        print("*** Error: The mesh file does not exist ***")
+        igg_path = raw_input("<> Please input the mesh file (.igg) full path: ")
+    
+    # Check to keep auxiliary python file
+    delete_python_script = raw_input("<> Do you want the auxiliary IGG python script to be deleted at the end? [y,n]: ")
+    
+    # Check to keep auxiliary block name file
+    delete_block_names_file = raw_input("<> Do you want the auxiliary block name file to be deleted at the end? [y,n]: ")
+    
+    # Check to keep auxiliary CFView macro
+    delete_cfview_file = raw_input("<> Do you want the auxiliary CFView macro to be deleted at the end? [y,n]: ")
+    
+    # Call the IGG script
+    block_dims = igg_get_block_names(igg_path,delete_python_script,
+                                     selection=block_names + regions_to_selection(regions))
+    
+    # Call the index search function
+    index_list, indices = get_block_indices_from_names(block_names + regions_to_selection(regions),
+                                                       delete_block_names_file)
+    nb_blocks = len(index_list)
+    
+    # Check that the selection fits in the memory of the node
+    check_selection_memory(index_list, block_dims)
+    
+    # Call the CFView function
+    if batch_run_files:
+        run_cfview_batch(batch_run_files, command_template, nb_blocks, indices, macro, cfview_licences)
+    else:
+        command = command_template % {"run": run_file, "nb_blocks": nb_blocks, "indices": indices}
+        run_cfview(command, macro, delete_cfview_file)
 
 print(">>> The script has been successfully run ")
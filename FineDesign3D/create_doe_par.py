@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##############################################################################
+
+
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+
+######################################################################
+#
+# Script creating design of experiment variants of a par file
+#
+# The parameters and their VALUE_MIN/VALUE_MAX are read from the .par
+# file (e.g. after create_easy_expressions_par.py). The samples are
+# drawn with NumPy and one .par file is written per sample.
+#
+######################################################################
+
+
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+import par_file
+
+# The script must be launched at the directory of the par file
+current_dir = os.getcwd()
+
+#---------- User defined parameters -------------------------------
+# Par file used as template. The extension has to be included
+file_name = "sample_new.par"
+
+# Parameters to sample. Leave empty to use all the user parameters
+# (USER_PARAMETERS block) with VALUE_MIN < VALUE_MAX
+doe_parameters = ["THICKNESS", "GAP_UNCERTAINTY"]
+
+# Sampling method: "lhs" (Latin hypercube), "sobol" or "factorial"
+# The full factorial design uses the NB_LEVELS of each parameter
+method = "lhs"
+
+# Number of samples (not used by the full factorial design)
+nb_samples = 100
+
+# Seed of the random generator, None for a different design at each run
+seed = 0
+
+# Directory where the .par variants and doe_samples.dat are written
+output_dir = "DOE"
+
+nb_processes = 4
+
+
+#--------- Functions -----------------------------------------------
+def get_ranges(par, names):
+    '''
+    Returns the VALUE_MIN, VALUE_MAX and NB_LEVELS arrays of the parameters
+    '''
+    lower = np.array([float(par.parameters[n].get("VALUE_MIN")) for n in names])
+    upper = np.array([float(par.parameters[n].get("VALUE_MAX")) for n in names])
+    levels = np.array([int(par.parameters[n].get("NB_LEVELS", "2")) for n in names])
+    return lower, upper, levels
+
+
+def latin_hypercube(n, d, rng):
+    '''
+    Latin hypercube design in [0, 1)^d. Each column is a random permutation
+    of the n strata with a random position inside each stratum.
+    '''
+    strata = np.argsort(rng.random_sample((n, d)), axis=0)
+    return (strata + rng.random_sample((n, d))) / n
+
+
+def sobol(n, d, seed):
+    '''
+    Scrambled Sobol sequence in [0, 1)^d (needs scipy >= 1.7)
+    '''
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        print("[Error] The Sobol sampling needs scipy 1.7 or newer, use lhs or factorial")
+        sys.exit()
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+
+def full_factorial(levels):
+    '''
+    Full factorial design in [0, 1]^d with levels[i] equally spaced levels
+    for parameter i
+    '''
+    axes = [np.linspace(0.0, 1.0, max(int(l), 2)) for l in levels]
+    grid = np.meshgrid(*axes, indexing="ij")
+    return np.column_stack([g.ravel() for g in grid])
+
+
+def init_worker(template):
+    '''
+    Parses the template once in each process of the pool
+    '''
+    global worker_par
+    worker_par = par_file.read_par(template)
+
+
+def write_variants(args):
+    '''
+    Writes the .par files of a chunk of samples (process pool worker)
+
+    Input: tuple (names, first sample number, sample values, output directory)
+
+    Output: number of files written
+    '''
+    names, first, values, out_dir = args
+    blocks = [worker_par.parameters[n] for n in names]
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    for i, row in enumerate(values):
+        for block, value in zip(blocks, row):
+            block.set("VALUE", "%.10g" % value)
+        worker_par.write(os.path.join(out_dir, "%s_doe_%s.par" % (base, first + i)))
+    return len(values)
+
+
+#--------- Main Program --------------------------------------------
+if __name__ == "__main__":
+    print("Starting Process")
+
+    par = par_file.read_par(file_name)
+
+    names = doe_parameters
+    if not names:
+        user_blocks = list(par.blocks("USER_PARAMETERS"))
+        names = [b.name for b in (user_blocks[0].blocks("PARAMETER") if user_blocks else [])
+                 if float(b.get("VALUE_MIN", 0)) < float(b.get("VALUE_MAX", 0))]
+    missing = [n for n in names if n not in par.parameters]
+    if missing:
+        print("[Error] Parameters not found in %s: %s" % (file_name, " ".join(missing)))
+        sys.exit()
+    if not names:
+        print("[Error] There is no parameter to sample")
+        sys.exit()
+
+    lower, upper, levels = get_ranges(par, names)
+    rng = np.random.RandomState(seed)
+    if method == "lhs":
+        unit = latin_hypercube(nb_samples, len(names), rng)
+    elif method == "sobol":
+        unit = sobol(nb_samples, len(names), seed)
+    elif method == "factorial":
+        unit = full_factorial(levels)
+    else:
+        print("[Error] Unknown sampling method %s" % method)
+        sys.exit()
+    samples = lower + unit * (upper - lower)
+    print("%s samples of %s parameters (%s)" % (len(samples), len(names), method))
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    np.savetxt(os.path.join(output_dir, "doe_samples.dat"),
+               np.column_stack([np.arange(len(samples)), samples]),
+               fmt=["%d"] + ["%.10g"] * len(names), header="sample " + " ".join(names))
+
+    # Split the samples in chunks written by the processes of the pool
+    chunk = max(1, int(np.ceil(len(samples) / float(nb_processes * 4))))
+    jobs = [(names, start, samples[start:start + chunk], output_dir)
+            for start in range(0, len(samples), chunk)]
+    pool = Pool(nb_processes, init_worker, (file_name,))
+    try:
+        written = sum(pool.map(write_variants, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+    print("%s .par files written in %s" % (written, output_dir))
+    print("Process finished")
@@ -37,6 +37,9 @@ __license__ = 'MIT'
 
 
 import os
+from multiprocessing import Pool
+
+import par_file
 
 # The scrip must be launched at the directory of the par file that needs changing
 current_dir = os.getcwd()
@@ -59,104 +62,58 @@ expressions_dict = {
 # Ranges of the new uncertain parameters to set
 unc_par_range = ["1","0.5", "1.5"]
 
+# Ranges of specific new parameters [value, min, max]. The parameters that
+# are not in this dictionary use unc_par_range
+# e.g. par_ranges = {"GAP_UNCERTAINTY" : ["1", "0.8", "1.2"]}
+par_ranges = {}
+
+# Batch mode: apply the expressions to every .par file under this directory
+# (e.g. "." for the current directory). The files are changed in place and
+# the changes are written in expressions_report.dat. Leave empty to only
+# create the _new file of file_name
+batch_dir = ""
+nb_processes = 4
+
 
 #--------- Main Program --------------------------------------------
-# open new file
+# The .par file is parsed and written back by par_file.py (same directory)
+# File format used from version 11.2 or newer -- Format in the bottom
 print("Starting Process")
 
-n = open(new_file, "w")
-
-with open(file_name, "r") as f:
-    # Parsing the .par file -- Format in the bottom
-    # File format used from version 11.2 or newer
-    is_param_block = False
-    is_required_param = False
-    is_user_param = False
-    count = 0
-    for line in f:
-        words = line.split()
-        if (len(words) == 2):
-            if (str(words[0]) == "NI_BEGIN") and (str(words[1]) == "USER_PARAMETERS"):
-                is_user_param = True
-                n.write(line)
-            elif (str(words[0]) == "NI_END") and (str(words[1]) == "USER_PARAMETERS"):
-                is_user_param = False
-                n.write(line)
-            elif is_user_param:
-                if (str(words[0]) == "NUMBER_OF_PARAMETERS"):
-                    num_param = int(words[1])
-                    num_param += len(expressions_dict)
-                    line_new = words[0] + "\t" + "+" + str(num_param) + "\n"
-                    n.write(line_new)
-                else:
-                    if count < len(expressions_dict):
-                        for key in expressions_dict:
-                            n.write("NI_BEGIN\t PARAMETER\n")
-                            n.write("NAME\t" + key + "\n")
-                            n.write("LIMIT_MIN\t -1000000000\n")
-                            n.write("LIMIT_MAX\t 1000000000\n")
-                            n.write("VALUE\t" + unc_par_range[0] + "\n")
-                            n.write("VALUE_MIN\t" + unc_par_range[1] + "\n")
-                            n.write("VALUE_MAX\t" + unc_par_range[2] + "\n")
-                            n.write("VALUE_REF\t 1\n")
-                            n.write("NB_LEVELS\t +2\n")
-                            n.write("QUANTITY_TYPE\t VALUE\n")
-                            n.write("UNCERTAIN\t FALSE\n")
-                            n.write("NI_END\t PARAMETER\n")
-                            count += 1
-                        else:
-                            n.write(line)
-                        is_user_param = False
-            else:
-                if (str(words[0]) == "NI_BEGIN") and (str(words[1]) == "PARAMETER"):
-                    is_param_block = True
-                    name  = ""
-                    value = ""
-                    quantity_type = "EXPRESSION"
-                    n.write(line)
-                elif (str(words[0]) == "NI_END") and (str(words[1]) == "PARAMETER"):
-                    is_param_block = False
-                    is_required_param = False
-                    n.write(line)
-                elif is_param_block == True:
-                    if str(words[0]) == "NAME":
-                        name = str(words[1])
-                        for key in expressions_dict:
-                            for dict_value in expressions_dict[key]:
-                                if dict_value in name:
-                                    is_required_param = True
-                                    key_name = key
-                        line_new = words[0] + "\t" + name + "\n"
-                        n.write(line_new)
-                    elif str(words[0]) == "VALUE":
-                        if is_required_param:
-                            value = str(words[1])
-                            line_new = words[0] + "\t" + value + "\n"
-                            n.write(line_new)
-                        else:
-                            n.write(line)
-                    elif str(words[0]) == "QUANTITY_TYPE":
-                        if is_required_param:
-                            line_new = words[0] + "\t" + quantity_type + "\n"
-                            n.write(line_new)
-                        else:
-                            n.write(line)
-                    elif str(words[0]) == "UNCERTAIN":
-                        n.write(line)
-                        if is_required_param:
-                            # write the new line
-                            # Example:
-                            #EXPRESSION                     "0.0003*GAP_UNCERTAINTY"
-                            line_new = 'EXPRESSION\t "' + value + '*' + key_name + '"\n' 
-                            n.write(line_new)
-                    else:
-                        n.write(line)
-                else:
-                    n.write(line)
-        else:
-            n.write(line)
-                
-n.close()
+ranges = dict((key, par_ranges.get(key, unc_par_range)) for key in expressions_dict)
+
+if batch_dir:
+    par_files = []
+    for folder, subfolder, files in os.walk(batch_dir):
+        for filename in files:
+            if filename.endswith(".par"):
+                par_files.append(os.path.join(folder, filename))
+    print("Processing %s .par files with %s processes" % (len(par_files), nb_processes))
+
+    pool = Pool(nb_processes)
+    try:
+        results = pool.map(par_file.rewrite_expressions,
+                           [(f, expressions_dict, ranges) for f in par_files], 16)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open("expressions_report.dat", "w") as report:
+        for name, changes, error in results:
+            if error:
+                print("[Error] %s: %s" % (name, error))
+                report.write("%s ERROR %s\n" % (name, error))
+                continue
+            print("%s: %s changes" % (name, len(changes)))
+            for parameter, change in changes:
+                report.write("%s %s %s\n" % (name, parameter, change))
+else:
+    par = par_file.read_par(file_name)
+    changes = par_file.make_expressions(par, expressions_dict, ranges)
+    for name, change in changes:
+        print("%s: %s" % (name, change))
+
+    par.write(new_file)
 
 print("Process finished")
 
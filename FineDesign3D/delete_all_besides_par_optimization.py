@@ -34,31 +34,271 @@ __license__ = 'MIT'
 
 
 import os
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from design_archive import pack_designs
+from design_results import design_number, rank_designs, read_value
+
+# os.scandir exists from Python 3.5, the scandir package provides it before
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 # This script needs to be run in _opt directory of the Design3D computation directory
 
-# USER INPUT: extensions of files to delete
+# USER INPUT: extensions of files to keep
 extensions = [".par"]
 
 # Names of the directories that contain the files we want to delete
 # Be careful if _mesh is part of the full path of the directory
 dir_names = ["_design"]
 
+# Retention policy: keep all the files of the keep_best best designs of each
+# objective and of the Pareto designs, only the extensions above for the other
+# designs and nothing for the failed designs (an objective is missing).
+# The objectives are the result files read by optim_results.py
+# e.g. objectives = {"stall_efficiency": "max", "choke_mass_flow": "max"}
+# Leave empty to keep the extensions above in every design
+objectives = {}
+keep_best = 5
+design_dir_name = "_design_"
+# The objective values are saved in this file, so that the designs whose
+# result files were deleted by a previous run are still ranked
+retention_file = "retention_results.dat"
+# A design with missing objectives is only deleted if its directory has not
+# changed for this number of hours (it may still be running)
+failed_age_hours = 24
+
+# Pack the kept files of the designs in one .zip archive (e.g. "designs.zip")
+# and remove their directories. The designs kept with all their files by the
+# retention policy are not packed. Extract a design with
+#     python design_archive.py designs.zip <design number>
+# Leave empty to keep the directories
+pack_archive = ""
+# Only the designs whose directory has not changed for this number of hours
+# are packed (the others may still be running)
+pack_age_hours = 1
+
+# Only report the number of files and bytes that would be deleted
+dry_run = False
+
+# Number of threads deleting files (hides the NFS latency)
+nb_threads = 16
+
 current_dir = os.getcwd()
 
-# Do this process for each extension in every directory
-for ext in extensions:
-    for name in dir_names:
-        print("[Info] Deleting all files in %s folders besides %s files") % (name, ext)
-        # Go through all lower directories
-        for folder, subfolder, files in os.walk(current_dir):
-            for filename in files:
-                full_path = os.path.join(folder, filename)
-                if (not filename.endswith(ext)) and (name in full_path):
-                    print("Deleting %s") % full_path
-                    os.unlink(full_path)
-            
-            if (not os.listdir(folder)):
-                print ("Deleting directory %s") % folder
-                os.rmdir(folder)
-        print("[Info] Finished deleting all files in %s folders besides %s files") % (name, ext)
+
+def list_dir(path):
+    '''
+    Returns the (name, full path, is directory, size function) of the
+    entries of a directory, using scandir when available
+    '''
+    entries = []
+    if scandir is not None:
+        for entry in scandir(path):
+            entries.append((entry.name, entry.path, entry.is_dir(follow_symlinks=False),
+                            lambda e=entry: e.stat(follow_symlinks=False).st_size))
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            entries.append((name, full_path, os.path.isdir(full_path) and not os.path.islink(full_path),
+                            lambda p=full_path: os.lstat(p).st_size))
+    return entries
+
+
+def scan_tree(top, quantities):
+    '''
+    Walks the tree once and records every file and directory. The values of
+    the result files of the quantities are read on the way.
+
+    Output: list of folders (path, parent index, depth, design number), list
+    of files (name, full path, folder index, size function), dictionary
+    design number -> {quantity: value}
+    '''
+    folders = [(top, None, 0, design_number(top, design_dir_name))]
+    files = []
+    results = {}
+    i = 0
+    # Folders are appended while they are visited (parents before children)
+    while i < len(folders):
+        folder, parent, depth, design = folders[i]
+        for name, full_path, is_dir, get_size in list_dir(folder):
+            if is_dir:
+                folders.append((full_path, i, depth + 1, design_number(full_path, design_dir_name)))
+            else:
+                files.append((name, full_path, i, get_size))
+                quantity = os.path.splitext(name)[0]
+                if design is not None and quantity in quantities:
+                    value = read_value(full_path)
+                    if value is not None:
+                        results.setdefault(design, {})[quantity] = float(value)
+        i += 1
+    return folders, files, results
+
+
+def load_retention_results():
+    '''
+    Reads the objective values saved by the previous runs
+    '''
+    saved = {}
+    if not os.path.isfile(retention_file):
+        return saved
+    with open(retention_file, "r") as f:
+        names = f.readline().split()[1:]
+        for line in f:
+            words = line.split()
+            saved[words[0]] = dict((q, float(v)) for q, v in zip(names, words[1:]) if v != "nan")
+    return saved
+
+
+def save_retention_results(results, designs):
+    names = sorted(objectives)
+    with open(retention_file, "w") as f:
+        f.write("design %s\n" % " ".join(names))
+        for d in designs:
+            f.write("%s %s\n" % (d, " ".join("%r" % results.get(d, {}).get(q, float("nan")) for q in names)))
+
+
+def get_tiers(results, folders):
+    '''
+    Returns the retention tier of each design (see rank_designs)
+
+    The values read in this run are completed with the saved values of the
+    previous runs. A design with missing objectives whose directory changed
+    less than failed_age_hours ago keeps all its files.
+
+    The program exits before anything is deleted if an objective is found in
+    no design (e.g. a misspelt name) or if no design has all the objectives,
+    as every design would then be deleted as failed. The values are not
+    saved in a dry run.
+    '''
+    saved = load_retention_results()
+    for d in saved:
+        merged = dict(saved[d])
+        merged.update(results.get(d, {}))
+        results[d] = merged
+
+    design_dirs = {}
+    for f in folders:
+        if f[3] is not None and design_dir_name in os.path.basename(f[0]):
+            design_dirs[f[3]] = f[0]
+    designs = sorted(design_dirs, key=lambda d: (len(d), d))
+
+    names = sorted(objectives)
+    values = [[results.get(d, {}).get(q, float("nan")) for q in names] for d in designs]
+    if designs:
+        not_found = [q for i, q in enumerate(names) if all(v[i] != v[i] for v in values)]
+        if not_found:
+            print("[Error] No result file found for the objectives %s" % " ".join(not_found))
+            print("[Error] Nothing is deleted, check the objectives")
+            sys.exit()
+        if not any(all(x == x for x in v) for v in values):
+            print("[Error] No design has a result for all the objectives %s" % " ".join(names))
+            print("[Error] Nothing is deleted, check the objectives")
+            sys.exit()
+    tiers = rank_designs(designs, values, [objectives[q] for q in names], keep_best)
+
+    now = time.time()
+    for d in designs:
+        if tiers[d] == "none" and now - os.path.getmtime(design_dirs[d]) < failed_age_hours * 3600.0:
+            tiers[d] = "full"
+
+    if not dry_run:
+        save_retention_results(results, sorted(set(designs) | set(saved), key=lambda d: (len(d), d)))
+    return tiers
+
+
+def plan_deletions(folders, files, tiers):
+    '''
+    Evaluates all the keep rules for every file and finds the folders that
+    become empty
+
+    A file is deleted if its path contains one of dir_names and it does not
+    end with one of the extensions. With the retention policy, all the files
+    of the "full" designs are kept and all the files of the "none" designs are
+    deleted. A folder is removed if all its files are deleted and all its
+    folders removed (the top folder and the folders of the "full" designs
+    are kept).
+
+    Output: list of files to delete, list of (folder, depth) to remove
+    '''
+    keep_ext = tuple(extensions)
+    in_scope = [any(n in f[0] for n in dir_names) for f in folders]
+    kept = [0] * len(folders)
+
+    files_to_delete = []
+    for name, full_path, index, get_size in files:
+        tier = tiers.get(folders[index][3])
+        if tier == "full":
+            delete = False
+        elif tier == "none":
+            delete = True
+        else:
+            delete = ((in_scope[index] or any(n in name for n in dir_names))
+                      and not name.endswith(keep_ext))
+        if delete:
+            files_to_delete.append((full_path, get_size))
+        else:
+            kept[index] += 1
+
+    # Children come after their parents, so going backwards is bottom-up
+    dirs_to_remove = []
+    for index in range(len(folders) - 1, 0, -1):
+        folder, parent, depth, design = folders[index]
+        if kept[index] == 0 and tiers.get(design) != "full":
+            dirs_to_remove.append((folder, depth))
+        else:
+            kept[parent] += 1
+    return files_to_delete, dirs_to_remove
+
+
+#---------- MAIN PROGRAM -------------------------------------------
+print("[Info] Deleting all files in %s folders besides %s files" % (" ".join(dir_names), " ".join(extensions)))
+
+folders, files, results = scan_tree(current_dir, set(objectives))
+
+tiers = {}
+if objectives:
+    tiers = get_tiers(results, folders)
+    for tier in ("full", "par", "none"):
+        print("[Info] %s designs with retention %s" % (list(tiers.values()).count(tier), tier))
+
+files_to_delete, dirs_to_remove = plan_deletions(folders, files, tiers)
+
+if dry_run:
+    size = sum(get_size() for full_path, get_size in files_to_delete)
+    print("[Info] Dry run: %s files (%.1f MB) and %s directories would be deleted"
+          % (len(files_to_delete), size / 1024.0**2, len(dirs_to_remove)))
+    sys.exit()
+
+# Designs to pack, their age is checked before the deletions change it
+design_dirs = []
+if pack_archive:
+    removed = set(d[0] for d in dirs_to_remove)
+    now = time.time()
+    design_dirs = [f[0] for f in folders
+                   if design_dir_name in os.path.basename(f[0]) and f[0] not in removed
+                   and tiers.get(f[3]) != "full"
+                   and now - os.path.getmtime(f[0]) >= pack_age_hours * 3600.0]
+
+pool = ThreadPool(nb_threads)
+try:
+    pool.map(os.unlink, [f[0] for f in files_to_delete], 256)
+    # Remove the empty directories one depth at a time, deepest first
+    for depth in sorted(set(d[1] for d in dirs_to_remove), reverse=True):
+        pool.map(os.rmdir, [d[0] for d in dirs_to_remove if d[1] == depth], 64)
+finally:
+    pool.close()
+    pool.join()
+
+print("[Info] Deleted %s files and %s directories" % (len(files_to_delete), len(dirs_to_remove)))
+
+if design_dirs:
+    nb_packed = pack_designs(pack_archive, design_dirs, current_dir, design_dir_name)
+    print("[Info] Packed %s designs in %s" % (nb_packed, pack_archive))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+######################################################################
+#
+# Archive of the pruned design directories of FINE/Design3D
+#
+# delete_all_besides_par_optimization.py packs the kept files of the
+# designs in one .zip file and removes the directories. The zip
+# central directory is the index, so the files of one design are
+# found without reading the rest of the archive.
+#
+# Extract the files of designs 12 and 57 in the current directory:
+#     python design_archive.py designs.zip 12 57
+#
+######################################################################
+
+
+import os
+import shutil
+import sys
+import zipfile
+
+from design_results import design_number
+
+
+def pack_designs(archive, design_dirs, top, dir_name="_design_"):
+    '''
+    Adds the files of the design directories to the archive and removes the
+    directories once the archive is closed
+
+    The designs of later runs are added to the same file. A design already in
+    the archive is not added again. Appending rewrites the central directory
+    of the archive, so it is done on a temporary copy that replaces the
+    archive once it is closed: if the run is interrupted (or the disk is
+    full), the archive of the previous runs is left untouched and no
+    directory is removed.
+
+    Input: archive path, list of design directories, directory the member
+    names are relative to
+
+    Output: number of designs packed
+    '''
+    packed = []
+    tmp_archive = "%s.%s.tmp" % (archive, os.getpid())
+    mode = "w"
+    if os.path.isfile(archive):
+        shutil.copy2(archive, tmp_archive)
+        mode = "a"
+    try:
+        with zipfile.ZipFile(tmp_archive, mode, zipfile.ZIP_DEFLATED, allowZip64=True) as z:
+            existing = set(design_number(n.replace("/", os.sep), dir_name) for n in z.namelist())
+            for design_dir in design_dirs:
+                if design_number(design_dir, dir_name) in existing:
+                    continue
+                for folder, subfolder, files in os.walk(design_dir):
+                    for filename in files:
+                        full_path = os.path.join(folder, filename)
+                        z.write(full_path, os.path.relpath(full_path, top).replace(os.sep, "/"))
+                packed.append(design_dir)
+    except BaseException:
+        if os.path.isfile(tmp_archive):
+            os.remove(tmp_archive)
+        raise
+
+    if not packed:
+        os.remove(tmp_archive)
+        return 0
+    os.rename(tmp_archive, archive)
+
+    for design_dir in packed:
+        shutil.rmtree(design_dir)
+    return len(packed)
+
+
+def design_members(z, design_nr, dir_name="_design_"):
+    '''
+    Returns the names of the members of an open archive that belong to a design
+    '''
+    design_nr = str(design_nr)
+    return [n for n in z.namelist()
+            if design_number(n.replace("/", os.sep), dir_name) == design_nr]
+
+
+def extract_design(archive, design_nr, out_dir=".", extension=None, dir_name="_design_"):
+    '''
+    Extracts the files of one design from the archive
+
+    Input: archive path, design number, output directory, extension of the
+    files to extract (e.g. ".par", None for all the files)
+
+    Output: list of the extracted paths
+    '''
+    with zipfile.ZipFile(archive, "r") as z:
+        members = design_members(z, design_nr, dir_name)
+        if extension is not None:
+            members = [n for n in members if n.endswith(extension)]
+        return [z.extract(n, out_dir) for n in members]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python design_archive.py <archive.zip> <design number> [<design number> ...]")
+        sys.exit()
+    for nr in sys.argv[2:]:
+        paths = extract_design(sys.argv[1], nr)
+        if not paths:
+            print("[Error] Design %s is not in %s" % (nr, sys.argv[1]))
+        for path in paths:
+            print("Extracted %s" % path)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+######################################################################
+#
+# SQLite database of the results of the designs of FINE/Design3D
+#
+# optim_results.py stores the harvested quantities and the design
+# parameters in the table "designs", one row per design (origin
+# "database" or "optimisation" and design number) and one column per
+# quantity or parameter. The quantity columns are indexed.
+#
+# Queries from the command line:
+#     python design_database.py optim_results.db filter "stall_efficiency>0.9" "choke_mass_flow<=12"
+#     python design_database.py optim_results.db top stall_efficiency:max 10
+#     python design_database.py optim_results.db pareto stall_efficiency:max static.fea_stress_max_vm:min
+#
+######################################################################
+
+
+import re
+import sqlite3
+import sys
+
+from design_results import np, pareto_mask, to_float
+
+# Comparison operators of the constraints
+OPERATORS = ("<=", ">=", "!=", "<", ">", "=")
+
+
+def quote(name):
+    '''Quotes a column name (the quantities may contain dots)'''
+    return '"%s"' % name.replace('"', '""')
+
+
+def columns(conn):
+    '''Returns the names of the columns of the designs table'''
+    return [row[1] for row in conn.execute("PRAGMA table_info(designs)")]
+
+
+def open_database(db_file, quantities=(), parameters=()):
+    '''
+    Opens the database and adds the missing columns of the quantities and
+    of the parameters, with an index on each quantity
+
+    Output: sqlite3 connection
+    '''
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE IF NOT EXISTS designs "
+                 "(origin TEXT, design INTEGER, PRIMARY KEY (origin, design))")
+    existing = set(columns(conn))
+    for name in list(quantities) + list(parameters):
+        if name not in existing:
+            conn.execute("ALTER TABLE designs ADD COLUMN %s REAL" % quote(name))
+            existing.add(name)
+    for name in quantities:
+        conn.execute("CREATE INDEX IF NOT EXISTS %s ON designs (%s)"
+                     % (quote("idx_" + name), quote(name)))
+    conn.commit()
+    return conn
+
+
+def store_designs(conn, names, values):
+    '''
+    Inserts or updates the designs
+
+    Input: connection, list of column names, dictionary
+    (origin, design number) -> list of the values in the order of names
+    (None for the missing values)
+    '''
+    if not values:
+        return
+    conn.executemany("INSERT OR IGNORE INTO designs (origin, design) VALUES (?, ?)",
+                     [(o, int(d)) for o, d in values])
+    if names:
+        assignments = ", ".join("%s = ?" % quote(n) for n in names)
+        conn.executemany("UPDATE designs SET %s WHERE origin = ? AND design = ?" % assignments,
+                         [[None if v is None else to_float(v) for v in values[k]] + [k[0], int(k[1])]
+                          for k in values])
+    conn.commit()
+
+
+def parse_constraint(text):
+    '''
+    Splits a constraint such as "stall_efficiency>=0.9" into
+    (column, operator, value)
+    '''
+    for operator in OPERATORS:
+        if operator in text:
+            name, value = text.split(operator, 1)
+            return name.strip(), operator, float(value)
+    raise ValueError("No comparison operator in the constraint %s" % text)
+
+
+def where_clause(constraints, not_null=()):
+    '''
+    Returns the WHERE clause of the constraints and its parameters
+
+    Input: list of (column, operator, value), columns that must not be NULL
+    '''
+    conditions = ["%s IS NOT NULL" % quote(n) for n in not_null]
+    parameters = []
+    for name, operator, value in constraints:
+        if operator not in OPERATORS:
+            raise ValueError("Unknown operator %s" % operator)
+        conditions.append("%s %s ?" % (quote(name), operator))
+        parameters.append(value)
+    if not conditions:
+        return "", parameters
+    return " WHERE " + " AND ".join(conditions), parameters
+
+
+def filter_designs(conn, constraints, names=None):
+    '''
+    Returns the designs satisfying all the constraints
+
+    Input: connection, list of (column, operator, value), columns to return
+    (all by default)
+
+    Output: list of the column names, list of rows
+    '''
+    names = names or columns(conn)
+    where, parameters = where_clause(constraints)
+    rows = conn.execute("SELECT %s FROM designs%s ORDER BY origin, design"
+                        % (", ".join(quote(n) for n in names), where), parameters).fetchall()
+    return names, rows
+
+
+def top_designs(conn, name, k, sense="min", constraints=(), names=None):
+    '''
+    Returns the k best designs for one quantity (using its index)
+
+    Output: list of the column names, list of rows
+    '''
+    names = names or columns(conn)
+    where, parameters = where_clause(constraints, [name])
+    order = "DESC" if sense == "max" else "ASC"
+    rows = conn.execute("SELECT %s FROM designs%s ORDER BY %s %s LIMIT ?"
+                        % (", ".join(quote(n) for n in names), where, quote(name), order),
+                        parameters + [int(k)]).fetchall()
+    return names, rows
+
+
+def pareto_designs(conn, objectives, constraints=(), names=None):
+    '''
+    Returns the non-dominated designs of several objectives
+
+    The designs satisfying the constraints are read in one query and the
+    non-dominated sort is done with NumPy (see pareto_mask), which is needed
+    for this query.
+
+    Input: connection, list of (quantity, "min"/"max"), list of
+    (column, operator, value), columns to return (all by default)
+
+    Output: list of the column names, list of rows
+    '''
+    if np is None:
+        raise ImportError("NumPy is needed for the Pareto designs")
+    names = names or columns(conn)
+    objective_names = [o[0] for o in objectives]
+    where, parameters = where_clause(constraints, objective_names)
+    rows = conn.execute("SELECT %s FROM designs%s ORDER BY origin, design"
+                        % (", ".join(quote(n) for n in objective_names + names), where),
+                        parameters).fetchall()
+    if not rows:
+        return names, []
+    nb = len(objectives)
+    signs = [-1.0 if sense == "max" else 1.0 for name, sense in objectives]
+    values = [[s * v for s, v in zip(signs, row[:nb])] for row in rows]
+    mask = pareto_mask(values)
+    return names, [row[nb:] for row, keep in zip(rows, mask) if keep]
+
+
+def print_rows(names, rows):
+    print(" ".join(names))
+    for row in rows:
+        print(" ".join("%s" % v for v in row))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[2] not in ("filter", "top", "pareto"):
+        print("Usage: python design_database.py <database> filter <constraint> [<constraint> ...]")
+        print("       python design_database.py <database> top <quantity>:<min|max> <k> [<constraint> ...]")
+        print("       python design_database.py <database> pareto <quantity>:<min|max> ... [<constraint> ...]")
+        sys.exit()
+
+    conn = sqlite3.connect(sys.argv[1])
+    query = sys.argv[2]
+    args = sys.argv[3:]
+    # The arguments with a comparison operator are constraints
+    constraints = [parse_constraint(a) for a in args if re.search("[<>=]", a)]
+    args = [a for a in args if not re.search("[<>=]", a)]
+    if query == "filter":
+        print_rows(*filter_designs(conn, constraints))
+    elif query == "top":
+        name, sense = args[0].rsplit(":", 1)
+        print_rows(*top_designs(conn, name, args[1], sense, constraints))
+    else:
+        objectives = [tuple(a.rsplit(":", 1)) for a in args]
+        print_rows(*pareto_designs(conn, objectives, constraints))
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+######################################################################
+#
+# Functions shared by the scripts reading the results of the designs
+# of FINE/Design3D (optim_results.py, retention of the cleaner, ...)
+#
+# A result file is named <quantity>.<extension> and its value is on
+# the last line starting with VALUE. The design number is taken from
+# the directory of the design, e.g. _design_12 (optimisation) or
+# _flow_12 (database).
+#
+######################################################################
+
+
+import json
+import os
+import re
+
+import par_file
+
+# Quantity of the .par files in the results of harvest_results
+PAR_FILE = ".par"
+
+# Directories of the database samples (_flow_12) and of the optimisation
+# designs (_design_12)
+SAMPLE_DIR = re.compile(r"_(flow|design)_(\d+)")
+ORIGINS = {"flow": "database", "design": "optimisation"}
+
+# Format of the manifest of harvest_results
+MANIFEST_VERSION = 2
+
+# NumPy is only needed for the ranking functions
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def design_number(path, dir_name="_design_"):
+    '''
+    Returns the design number of a path (e.g. 12 for .../_design_12/...)
+    as a string, or None if no directory of the path contains dir_name
+    '''
+    design_nr = None
+    for item in path.split(os.sep):
+        if dir_name in item:
+            design_nr = item.split("_")[2]
+    return design_nr
+
+
+def read_value(file_path, block_size=4096):
+    '''
+    Returns the value of the last VALUE line of a result file as a string,
+    or None if the file has no VALUE line
+
+    The file is read backward from its end, block_size bytes at a time, so
+    that only the last lines are read in most cases.
+    '''
+    with open(file_path, "rb") as infile:
+        infile.seek(0, os.SEEK_END)
+        position = infile.tell()
+        tail = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            infile.seek(position)
+            lines = (infile.read(size) + tail).split(b"\n")
+            # The first line may be incomplete unless the start of the file is reached
+            tail = lines.pop(0) if position > 0 else b""
+            for line in reversed(lines):
+                words = line.split()
+                if len(words) >= 2 and words[0] == b"VALUE":
+                    return str(words[1].decode("latin-1"))
+    return None
+
+
+def load_manifest(file_name):
+    '''
+    Reads the manifest of the previous harvest (see harvest_results), an
+    empty manifest if the file does not exist or cannot be read
+    '''
+    manifest = {"designs": {}, "files": {}}
+    if file_name and os.path.isfile(file_name):
+        try:
+            with open(file_name, "r") as f:
+                manifest = json.load(f)
+        except ValueError:
+            print("[Warning] Cannot read %s, all the designs are read again" % file_name)
+    return manifest
+
+
+def save_manifest(manifest, file_name):
+    tmp_file = "%s.%s.tmp" % (file_name, os.getpid())
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.rename(tmp_file, file_name)
+
+
+def read_parameters(par_path, names):
+    '''
+    Returns the dictionary name -> VALUE of the parameters of a .par file
+    (the names not in the file are left out)
+    '''
+    par = par_file.read_par(par_path)
+    return dict((n, str(par.parameters[n].get("VALUE"))) for n in names if n in par.parameters)
+
+
+def classify_dir(name):
+    '''
+    Returns (origin, design number) of a design directory name, e.g.
+    ("optimisation", "12") for _design_12 and ("database", "12") for
+    _flow_12, or None for the other directories
+    '''
+    m = SAMPLE_DIR.match(name)
+    if m is None:
+        return None
+    return ORIGINS[m.group(1)], m.group(2)
+
+
+def harvest_results(top, quantities, manifest, map_function=map, parameters=None):
+    '''
+    Finds and reads the result files of all the quantities in one walk of
+    the tree, reusing the manifest of the previous harvest
+
+    The database samples (_flow_ directories) and the optimisation designs
+    (_design_ directories) are recognised from their directory names, so
+    both are harvested in the same walk.
+
+    The manifest records the mtime of each design directory, whether all the
+    quantities were found in it, and the path, mtime and value of each
+    result file. A complete design whose directory did not change is not
+    walked again. In the other designs, only the result files whose mtime
+    changed are read. The manifest is updated in place.
+
+    If parameters is given, the .par file at the top of each design
+    directory is read as well and its value is the dictionary of the
+    parameters (see read_parameters), with the quantity PAR_FILE.
+
+    Input: top directory, list of quantities (file names without extension),
+    manifest (see load_manifest), map function used to read the files (e.g.
+    the map of a thread pool), list of parameter names
+
+    Output: list of (quantity, origin, design number, value, path), number of
+    files read. The result files outside of the design directories are not
+    read and not returned.
+    '''
+    keys = sorted(quantities) + sorted(parameters or [])
+    wanted = set(quantities)
+    if parameters:
+        wanted.add(PAR_FILE)
+    old_designs = manifest.get("designs", {})
+    old_files = manifest.get("files", {})
+    # The complete designs of the manifest are walked again if the
+    # quantities or the parameters changed
+    if manifest.get("version") != MANIFEST_VERSION:
+        old_designs, old_files = {}, {}
+    elif manifest.get("keys") != keys:
+        old_designs = {}
+    designs = {}
+    files = {}
+    to_read = []
+
+    def add_file(quantity, origin, design_nr, full_path):
+        mtime = os.path.getmtime(full_path)
+        entry = old_files.get(full_path)
+        if entry is not None and entry[0] == mtime:
+            files[full_path] = entry
+        else:
+            files[full_path] = [mtime, quantity, origin, design_nr, None]
+            to_read.append(full_path)
+
+    def read(path):
+        if files[path][1] == PAR_FILE:
+            return read_parameters(path, parameters)
+        return read_value(path)
+
+    for folder, subfolders, filenames in os.walk(top):
+        for name in list(subfolders):
+            sample = classify_dir(name)
+            if sample is None:
+                continue
+            # The design directories are handled here, not by the outer walk
+            subfolders.remove(name)
+            origin, design_nr = sample
+            design_dir = os.path.join(folder, name)
+            mtime = os.path.getmtime(design_dir)
+            old = old_designs.get(design_dir)
+            if old is not None and old["complete"] and old["mtime"] == mtime:
+                designs[design_dir] = old
+                for path in old["files"]:
+                    files[path] = old_files[path]
+                continue
+            found = []
+            for sub_folder, sub_subfolders, sub_filenames in os.walk(design_dir):
+                for filename in sub_filenames:
+                    quantity = os.path.splitext(filename)[0]
+                    if parameters and sub_folder == design_dir and filename.endswith(".par"):
+                        quantity = PAR_FILE
+                    if quantity in wanted:
+                        full_path = os.path.join(sub_folder, filename)
+                        add_file(quantity, origin, design_nr, full_path)
+                        found.append(full_path)
+            designs[design_dir] = {"mtime": mtime, "files": found, "complete": False}
+
+    for path, value in zip(to_read, map_function(read, to_read)):
+        files[path][4] = value
+
+    for entry in designs.values():
+        if not entry["complete"]:
+            found = set(files[p][1] for p in entry["files"] if files[p][4] is not None)
+            entry["complete"] = found == wanted
+
+    manifest["version"] = MANIFEST_VERSION
+    manifest["keys"] = keys
+    manifest["designs"] = designs
+    manifest["files"] = files
+    results = [(f[1], f[2], f[3], f[4], path) for path, f in files.items()]
+    return results, len(to_read)
+
+
+def join_results(results, quantities):
+    '''
+    Joins the values of the quantities by origin and design number
+
+    Input: list of (quantity, origin, design number, value, ...), list of
+    quantities
+
+    Output: list of the (origin, design number) keys (sorted), dictionary
+    key -> list of the values in the order of quantities (None for the
+    missing values)
+    '''
+    column = dict((q, i) for i, q in enumerate(quantities))
+    rows = {}
+    for result in results:
+        quantity, origin, design_nr, value = result[:4]
+        if quantity not in column:
+            continue
+        key = (origin, design_nr)
+        if key not in rows:
+            rows[key] = [None] * len(quantities)
+        rows[key][column[quantity]] = value
+    designs = sorted(rows, key=lambda k: (k[0], len(k[1]), k[1]))
+    return designs, rows
+
+
+def write_table(base_name, quantities, designs, rows):
+    '''
+    Writes the joined results (see join_results) as <base_name>.csv and, if
+    NumPy is available, as the structured array <base_name>.npy (fields
+    origin, design and one field per quantity, nan for the missing values).
+    Load the binary table with np.load(file_name).
+
+    Output: list of the written files
+    '''
+    with open(base_name + ".csv", "w") as f:
+        f.write(",".join(["origin", "design"] + list(quantities)) + "\n")
+        for key in designs:
+            values = ["" if v is None else v for v in rows[key]]
+            f.write(",".join(list(key) + values) + "\n")
+    written = [base_name + ".csv"]
+    if np is None:
+        return written
+
+    dtype = [("origin", "U12"), ("design", "i8")] + [(str(q), "f8") for q in quantities]
+    table = np.empty(len(designs), dtype=dtype)
+    table["origin"] = [k[0] for k in designs]
+    table["design"] = [int(k[1]) for k in designs]
+    for i, q in enumerate(quantities):
+        table[str(q)] = [to_float(rows[k][i]) for k in designs]
+    np.save(base_name + ".npy", table)
+    written.append(base_name + ".npy")
+    return written
+
+
+def to_float(value):
+    '''Converts a value to float, nan if it is missing or not a number'''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def pareto_mask(values, chunk=1024):
+    '''
+    Returns the boolean mask of the non-dominated rows of values (all the
+    objectives are minimised)
+
+    A row is dominated if another row is lower or equal for every objective
+    and lower for at least one. The comparison is vectorised, chunk rows at a
+    time, so that the memory stays bounded for large number of designs.
+
+    Input: (designs x objectives) array
+
+    Output: boolean array, True for the Pareto designs
+    '''
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    dominated = np.zeros(n, dtype=bool)
+    for start in range(0, n, chunk):
+        block = values[start:start + chunk]
+        # le[i, j]: design j is lower or equal than design start+i for all objectives
+        le = np.all(values[None, :, :] <= block[:, None, :], axis=2)
+        lt = np.any(values[None, :, :] < block[:, None, :], axis=2)
+        dominated[start:start + chunk] = np.any(le & lt, axis=1)
+    return ~dominated
+
+
+def rank_designs(designs, values, senses, keep_best):
+    '''
+    Splits the designs in retention tiers from their objectives
+
+        "full": the keep_best best designs of each objective and the Pareto set
+        "par":  the other designs with all the objectives
+        "none": the failed designs (at least one objective missing)
+
+    Input: list of design numbers, (designs x objectives) array with nan for
+    the missing values, list of "min"/"max" for each objective, number of
+    best designs to keep for each objective
+
+    Output: dictionary design number -> tier
+    '''
+    values = np.asarray(values, dtype=float).reshape(len(designs), len(senses))
+    # Change the maximised objectives so that all of them are minimised
+    signs = np.array([-1.0 if s == "max" else 1.0 for s in senses])
+    values = values * signs
+
+    ok = ~np.any(np.isnan(values), axis=1)
+    full = np.zeros(len(designs), dtype=bool)
+    ok_rows = np.nonzero(ok)[0]
+    if len(ok_rows):
+        ok_values = values[ok_rows]
+        order = np.argsort(ok_values, axis=0)[:keep_best]
+        full[ok_rows[order.ravel()]] = True
+        full[ok_rows[pareto_mask(ok_values)]] = True
+
+    tiers = {}
+    for i, design in enumerate(designs):
+        if not ok[i]:
+            tiers[design] = "none"
+        elif full[i]:
+            tiers[design] = "full"
+        else:
+            tiers[design] = "par"
+    return tiers
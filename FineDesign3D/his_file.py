@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+######################################################################
+#
+# Streaming reader for the .his files of FINE/Design3D
+#
+# The names of the STATISTICS_NAMES blocks become the fields of a
+# NumPy structured array and each DESIGN_SAMPLE block is appended to
+# it as one row (design number, simulation path, statistics). The file
+# is read once, line by line, so only the samples are kept in memory.
+#
+# Usage (in a script in the same directory):
+#     import his_file
+#     samples = his_file.read_his("sample.his")
+#     his_file.save_samples("moments_global.npy", samples)
+#     samples = his_file.load_samples("moments_global.npy")
+#
+######################################################################
+
+
+import io
+import os
+
+import numpy as np
+
+from design_results import design_number
+
+# Lines are read as latin-1 so that any byte is accepted
+ENCODING = "latin-1"
+
+# Initial number of bytes of the simulation path field, widened when a
+# longer path is read so that no path is cut
+PATH_SIZE = 256
+
+
+class HisParser(object):
+    '''
+    Line by line parser of a .his file
+
+    feed() is called with each line of the file and returns a completed
+    DESIGN_SAMPLE as (design number, simulation path, list of values), or
+    None. The statistics names are collected in names.
+    '''
+
+    def __init__(self, dir_name="_design_"):
+        self.dir_name = dir_name
+        self.names = []
+        self.in_names = False
+        self.in_sample = False
+        self.values = []
+        self.path = ""
+
+    def feed(self, line):
+        words = line.split()
+        if len(words) < 2:
+            return None
+        key = words[0]
+        if key == "NI_BEGIN" and words[1] == "STATISTICS_NAMES":
+            self.in_names = True
+        elif key == "NI_END" and words[1] == "STATISTICS_NAMES":
+            self.in_names = False
+        elif self.in_names and key == "STATISTICS":
+            self.names.append(str(words[1]))
+        elif key == "NI_BEGIN" and words[1] == "DESIGN_SAMPLE":
+            self.in_sample = True
+            self.values = []
+            self.path = ""
+        elif key == "NI_END" and words[1] == "DESIGN_SAMPLE":
+            self.in_sample = False
+            # Only the samples of the designs are kept
+            if self.dir_name in self.path:
+                design_nr = design_number(self.path, self.dir_name)
+                return int(design_nr) if design_nr and design_nr.isdigit() else -1, self.path, self.values
+        elif self.in_sample:
+            if "DESIGN_STATISTICS" in key:
+                self.values = words[1:]
+            elif key == "SIMULATION_PATH":
+                self.path = words[1]
+        return None
+
+
+def sample_dtype(names, path_size=PATH_SIZE):
+    '''
+    Returns the dtype of the samples: design, path (bytes) and one float
+    field per statistics name
+    '''
+    return np.dtype([("design", "i8"), ("path", "S%s" % path_size)]
+                    + [(str(n), "f8") for n in names])
+
+
+class SampleArray(object):
+    '''
+    Structured array growing by doubling its capacity, so that appending
+    one sample costs O(1) on average. The path field is widened when a
+    longer path is appended.
+    '''
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def fit_path(self, size):
+        '''Widens the path field to at least size bytes'''
+        if size > self.data.dtype["path"].itemsize:
+            dtype = np.dtype([(n, "S%s" % size if n == "path" else self.data.dtype[n])
+                              for n in self.data.dtype.names])
+            self.data = self.data.astype(dtype)
+
+    def append(self, design_nr, path, values):
+        if self.size == len(self.data):
+            self.data = np.resize(self.data, 2 * len(self.data))
+        path = path if isinstance(path, bytes) else path.encode(ENCODING)
+        self.fit_path(len(path))
+        row = self.data[self.size]
+        row["design"] = design_nr
+        row["path"] = path
+        names = self.data.dtype.names[2:]
+        for i, name in enumerate(names):
+            try:
+                row[name] = float(values[i])
+            except (IndexError, ValueError):
+                row[name] = np.nan
+        self.size += 1
+
+    def extend(self, samples):
+        '''Appends the rows of a samples array with the same dtype'''
+        while self.size + len(samples) > len(self.data):
+            self.data = np.resize(self.data, 2 * len(self.data))
+        self.fit_path(samples.dtype["path"].itemsize)
+        self.data[self.size:self.size + len(samples)] = samples
+        self.size += len(samples)
+
+    def array(self):
+        '''Returns the samples appended so far'''
+        return self.data[:self.size]
+
+
+def iter_samples(lines, dir_name="_design_"):
+    '''
+    Parses the lines of a .his file and yields (names, sample) for each
+    DESIGN_SAMPLE of the designs, see HisParser
+    '''
+    parser = HisParser(dir_name)
+    for line in lines:
+        sample = parser.feed(line)
+        if sample is not None:
+            yield parser.names, sample
+
+
+def read_his(file_name, dir_name="_design_", path_size=PATH_SIZE):
+    '''
+    Reads the samples of the designs of a .his file in one pass
+
+    Output: structured array (see sample_dtype), one row per sample
+    '''
+    samples = None
+    with io.open(file_name, "r", encoding=ENCODING) as f:
+        for names, (design_nr, path, values) in iter_samples(f, dir_name):
+            if samples is None:
+                samples = SampleArray(sample_dtype(names, path_size))
+            samples.append(design_nr, path, values)
+    if samples is None:
+        return np.empty(0, dtype=sample_dtype([], path_size))
+    return samples.array()
+
+
+class HisFollower(object):
+    '''
+    Reads the samples appended to a .his file that is still written
+
+    The byte offset after the last complete DESIGN_SAMPLE and the statistics
+    names read until there are kept. Each poll() parses the file from this
+    offset only. A block that is not completely written yet is parsed again
+    at the next poll. If the file becomes shorter than the offset (new
+    computation), it is read again from the start.
+
+    The state can be saved with state() and given back to the constructor,
+    so that a later run of the script carries on where this one stopped.
+    '''
+
+    def __init__(self, file_name, dir_name="_design_", path_size=PATH_SIZE,
+                 state=None, samples=None):
+        self.file_name = file_name
+        self.dir_name = dir_name
+        self.path_size = path_size
+        self.offset = 0
+        self.names = []
+        self.samples = None
+        if state is not None and samples is not None:
+            self.offset = state["offset"]
+            self.names = list(state["names"])
+            if len(samples):
+                self.samples = SampleArray(samples.dtype, max(len(samples), 1024))
+                self.samples.extend(samples)
+
+    def state(self):
+        return {"file": self.file_name, "offset": self.offset, "names": self.names}
+
+    def poll(self):
+        '''
+        Parses the complete samples appended since the last poll
+
+        Output: structured array of the new samples (see sample_dtype)
+        '''
+        if os.path.getsize(self.file_name) < self.offset:
+            self.offset = 0
+            self.names = []
+            self.samples = None
+        parser = HisParser(self.dir_name)
+        parser.names = list(self.names)
+        first = self.samples.size if self.samples is not None else 0
+        with open(self.file_name, "rb") as f:
+            f.seek(self.offset)
+            position = self.offset
+            for raw in f:
+                # The last line may not be completely written
+                if not raw.endswith(b"\n"):
+                    break
+                position += len(raw)
+                line = raw.decode(ENCODING)
+                sample = parser.feed(line)
+                words = line.split()
+                if parser.in_sample or parser.in_names or not words or words[0] != "NI_END":
+                    continue
+                # End of a block, the parser state can be saved
+                self.offset = position
+                self.names = list(parser.names)
+                if sample is not None:
+                    if self.samples is None:
+                        self.samples = SampleArray(sample_dtype(parser.names, self.path_size))
+                    self.samples.append(*sample)
+        if self.samples is None:
+            return np.empty(0, dtype=sample_dtype(self.names, self.path_size))
+        return self.samples.array()[first:]
+
+    def array(self):
+        '''Returns all the samples read so far'''
+        if self.samples is None:
+            return np.empty(0, dtype=sample_dtype(self.names, self.path_size))
+        return self.samples.array()
+
+
+def statistics_names(samples):
+    '''Returns the statistics names of a samples array'''
+    return [n for n in samples.dtype.names if n not in ("computation", "design", "path")]
+
+
+def format_value(value):
+    '''
+    Returns the shortest text that reads back to the same float, so that the
+    values of the .his file (e.g. 0.9) are written as they were read
+    '''
+    return repr(float(value))
+
+
+def write_moments(file_name, samples, append=False):
+    '''
+    Writes the statistics of the samples as text, one line per sample after
+    the line of the names (not written when appending)
+    '''
+    names = statistics_names(samples)
+    with open(file_name, "a" if append else "w") as outfile:
+        if not append:
+            outfile.write(" ".join(names) + "\n")
+        for row in samples:
+            outfile.write(" ".join(format_value(row[n]) for n in names) + "\n")
+
+
+def process_his(args):
+    '''
+    Reads a .his file and writes its samples in <output_name>.dat and
+    <output_name>.npy (process pool worker)
+
+    Input: tuple (.his file, string of the design directories, output name)
+
+    Output: samples array
+    '''
+    file_name, dir_name, output_name = args
+    samples = read_his(file_name, dir_name)
+    write_moments(output_name + ".dat", samples)
+    save_samples(output_name + ".npy", samples)
+    return samples
+
+
+def merge_samples(computations, sample_arrays):
+    '''
+    Merges the samples of several computations in one array with the
+    computation name as first field. The statistics fields are the union of
+    the fields of all the computations (nan where a computation does not
+    have the statistics).
+    '''
+    names = []
+    for samples in sample_arrays:
+        names += [n for n in statistics_names(samples) if n not in names]
+    size = max([len(c) for c in computations] + [1])
+    path_size = max([samples.dtype["path"].itemsize for samples in sample_arrays] + [PATH_SIZE])
+    dtype = np.dtype([("computation", "S%s" % size)] + sample_dtype(names, path_size).descr)
+    merged = np.empty(sum(len(samples) for samples in sample_arrays), dtype=dtype)
+    for name in names:
+        merged[name] = np.nan
+    start = 0
+    for computation, samples in zip(computations, sample_arrays):
+        block = merged[start:start + len(samples)]
+        block["computation"] = computation.encode(ENCODING)
+        for name in samples.dtype.names:
+            block[name] = samples[name]
+        start += len(samples)
+    return merged
+
+
+def save_samples(file_name, samples):
+    np.save(file_name, samples)
+
+
+def load_samples(file_name):
+    return np.load(file_name)
@@ -36,6 +36,10 @@ __license__ = 'MIT'
 
 import os
 import sys
+from multiprocessing.pool import ThreadPool
+
+from design_database import open_database, store_designs
+from design_results import PAR_FILE, harvest_results, join_results, load_manifest, save_manifest, write_table
 
 #----------- USER INPUTS --------------------------------------------
 # This script needs to be run in the Design3D computation directory
@@ -43,44 +47,85 @@ import sys
 # USER INPUT: names of files
 file_names = ["choke_mass_flow", "stall_efficiency", "stall_pressure_ratio", "static.fea_stress_max_vm"]
 
-# If database use _flow_, if optimization, use _design_
-dir_name = "_design_"
+# The database samples (_flow_ directories) and the optimisation designs
+# (_design_ directories) are found in the same run. The origin column of
+# the outputs is "database" or "optimisation".
+
+# Name of the joined table, one row per design and one column per quantity
+# (<table_name>.csv and <table_name>.npy if NumPy is available)
+table_name = "optim_results"
+
+# Also write one <quantity>_global.dat file per quantity (design number and
+# value on each line) for the optimisation designs, and one
+# <quantity>_database_global.dat file for the database samples if there are any
+write_global_files = True
+
+# SQLite database of the quantities and of the design parameters, queried
+# with design_database.py (filters, top designs, Pareto designs).
+# Leave empty to skip the database
+database_file = "optim_results.db"
+
+# Parameters read from the .par file of each design and stored in the
+# database (e.g. ["THICKNESS", "GAP_UNCERTAINTY"])
+par_parameters = []
+
+# Manifest of the files read by the previous runs. When the script is run
+# again during the optimisation, only the new and changed designs are read.
+# Leave empty to read all the designs at every run
+manifest_file = "optim_results_manifest.json"
+
+# Number of threads reading the result files (hides the NFS latency)
+nb_threads = 16
 
 
 #---------- MAIN PROGRAM -------------------------------------------
 # Get the working directory
 current_dir = os.getcwd()
 
-# Do this process for each quantity
-for quantity in file_names:
-    with open(quantity + "_global.dat", "w") as f:
-        print("Processing files for quantity %s") %(quantity)
-        # Go through all lower directories
-        for folder, subfolder, files in os.walk(current_dir):
-            for filename in files:
-                # Open the quantity file and extract the quantity
-                if os.path.splitext(filename)[0] == quantity:
-                    infile = open(os.path.join(folder, filename), "r")
-                    print("Processing %s") % os.path.join(folder, filename)
-                    # Read information from filename
-                    for line in infile:
-                        words = line.split()
-                        if words[0] == "VALUE":
-                            value = words[1]
-                    infile.close()
-                    # Get the design number information
-                    full_path = os.path.join(folder, filename).split(os.sep)
-                    for item in full_path:
-                        if dir_name in item:
-                            design_nr = item.split("_")[2]
-                            
-                    try:
-                        f.write("%s %s\n" %(design_nr, value))
-                    except NameError:
-                        print("Check the variabe dir_name. If this is a database, use _flow_ else use _design_")
-                        print("The program will now exit")
-                        sys.exit()
-                    #if design_nr:
-                    #    f.write("%s %s\n" %(design_nr, value))
-                        
-        print("Finished processing for quantity %s") %quantity
+print("Searching the result files of %s" % ", ".join(file_names))
+manifest = load_manifest(manifest_file)
+pool = ThreadPool(nb_threads)
+try:
+    # The values are returned in the order of the paths
+    results, nb_read = harvest_results(current_dir, file_names, manifest,
+                                       lambda read, paths: pool.map(read, paths, 64),
+                                       par_parameters)
+finally:
+    pool.close()
+    pool.join()
+if not results:
+    print("[Error] No result file found in the _design_ or _flow_ directories")
+    print("The program will now exit")
+    sys.exit()
+print("%s result files read, %s unchanged since the last run" % (nb_read, len(results) - nb_read))
+if manifest_file:
+    save_manifest(manifest, manifest_file)
+
+designs, rows = join_results(results, file_names)
+
+if write_global_files:
+    # Two columns as before, one file per origin
+    suffixes = {"optimisation": "_global.dat", "database": "_database_global.dat"}
+    for origin in suffixes:
+        keys = [key for key in designs if key[0] == origin]
+        if not keys and origin != "optimisation":
+            continue
+        for i, quantity in enumerate(file_names):
+            with open(quantity + suffixes[origin], "w") as f:
+                for key in keys:
+                    if rows[key][i] is not None:
+                        f.write("%s %s\n" % (key[1], rows[key][i]))
+
+written = write_table(table_name, file_names, designs, rows)
+print("Results of %s designs written in %s" % (len(designs), " ".join(written)))
+
+if database_file:
+    values = dict((d, rows[d] + [None] * len(par_parameters)) for d in designs)
+    for quantity, origin, design_nr, value, path in results:
+        if quantity == PAR_FILE and value is not None:
+            row = values.setdefault((origin, design_nr), [None] * (len(file_names) + len(par_parameters)))
+            row[len(file_names):] = [value.get(p) for p in par_parameters]
+    conn = open_database(database_file, file_names, par_parameters)
+    store_designs(conn, list(file_names) + list(par_parameters), values)
+    conn.close()
+    print("Results of %s designs stored in %s" % (len(values), database_file))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##############################################################################
+
+from __future__ import unicode_literals
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+
+######################################################################
+#
+# Reader and writer for the FINE/Design3D .par files
+#
+# The file is parsed into a tree of NI_BEGIN/NI_END blocks. Every line
+# keeps its original text, so lines that are not changed are written
+# back byte for byte. The PARAMETER blocks are indexed by NAME.
+#
+# Usage (in a script in the same directory):
+#     import par_file
+#     par = par_file.read_par("sample.par")
+#     par.parameters["SHROUD_GAP_WIDTH"].set("VALUE", "0.0004")
+#     par.write("sample_new.par")
+#
+######################################################################
+
+
+import io
+import os
+import re
+
+# Lines are read as latin-1 so that any byte is kept unchanged
+ENCODING = "latin-1"
+
+# key, spacing and value of a "KEY   VALUE" line
+LINE_FORMAT = re.compile(r"^(\s*)(\S+)(\s*)(.*?)(\s*)$")
+
+
+class ParLine(object):
+    '''
+    One "KEY VALUE" line of a .par file
+
+    The original text (with its line ending) is kept in raw. Setting the
+    value only replaces the value, the indentation and spacing are kept.
+    '''
+    __slots__ = ("raw", "key", "value")
+
+    def __init__(self, raw):
+        self.raw = raw
+        words = raw.split(None, 1)
+        self.key = words[0] if words else ""
+        self.value = words[1].strip() if len(words) == 2 else ""
+
+    def set_value(self, value):
+        value = "%s" % value
+        if value == self.value:
+            return
+        body = self.raw.rstrip("\r\n")
+        ending = self.raw[len(body):]
+        m = LINE_FORMAT.match(body)
+        spacing = m.group(3) or "\t"
+        self.raw = m.group(1) + m.group(2) + spacing + value + m.group(5) + ending
+        self.value = value
+
+
+class ParBlock(object):
+    '''
+    NI_BEGIN <kind> ... NI_END <kind> block of a .par file
+
+    items contains the ParLine and ParBlock objects of the block in the
+    order of the file. begin and end are the original NI_BEGIN and NI_END
+    lines (None for the root of the file).
+    '''
+
+    def __init__(self, kind, begin=None):
+        self.kind = kind
+        self.begin = begin
+        self.end = None
+        self.items = []
+
+    @property
+    def name(self):
+        return self.get("NAME")
+
+    def line(self, key):
+        '''Returns the first ParLine of the block with this key or None'''
+        for item in self.items:
+            if isinstance(item, ParLine) and item.key == key:
+                return item
+        return None
+
+    def get(self, key, default=None):
+        '''Returns the value of the first line of the block with this key'''
+        item = self.line(key)
+        return default if item is None else item.value
+
+    def set(self, key, value):
+        '''Changes the value of a line of the block, the line must exist'''
+        item = self.line(key)
+        if item is None:
+            raise KeyError("%s not in %s block" % (key, self.kind))
+        item.set_value(value)
+
+    def insert_after(self, after_key, key, value):
+        '''
+        Adds a "KEY VALUE" line after the line after_key (at the end of the
+        block if after_key does not exist), with the indentation of that line
+        '''
+        position = len(self.items)
+        indent = ""
+        newline = "\n"
+        for i, item in enumerate(self.items):
+            if isinstance(item, ParLine) and item.key == after_key:
+                position = i + 1
+                indent = LINE_FORMAT.match(item.raw).group(1)
+                newline = "\r\n" if item.raw.endswith("\r\n") else "\n"
+                break
+        new_line = ParLine("%s%s\t %s%s" % (indent, key, value, newline))
+        self.items.insert(position, new_line)
+        return new_line
+
+    def blocks(self, kind=None):
+        '''Iterates over all the blocks under this block (depth first)'''
+        for item in self.items:
+            if isinstance(item, ParBlock):
+                if kind is None or item.kind == kind:
+                    yield item
+                for sub_block in item.blocks(kind):
+                    yield sub_block
+
+    def lines(self):
+        '''Iterates over the text lines of the block'''
+        if self.begin is not None:
+            yield self.begin
+        for item in self.items:
+            if isinstance(item, ParBlock):
+                for line in item.lines():
+                    yield line
+            else:
+                yield item.raw
+        if self.end is not None:
+            yield self.end
+
+
+class ParFile(ParBlock):
+    '''
+    Parsed .par file
+
+    parameters is the NAME -> PARAMETER block index. If a name is used by
+    more than one PARAMETER block, the first block of the file is indexed.
+    '''
+
+    def __init__(self):
+        ParBlock.__init__(self, None)
+        self.parameters = {}
+
+    def index_parameters(self):
+        self.parameters = {}
+        for block in self.blocks("PARAMETER"):
+            name = block.name
+            if name is not None and name not in self.parameters:
+                self.parameters[name] = block
+
+    def add_parameter(self, parent, block, position=None):
+        '''Adds a PARAMETER block to the parent block and to the index'''
+        if position is None:
+            parent.items.append(block)
+        else:
+            parent.items.insert(position, block)
+        if block.name not in self.parameters:
+            self.parameters[block.name] = block
+
+    def find_parameters(self, patterns):
+        '''
+        Finds the parameters whose name contains one of the patterns
+
+        All the patterns are compiled into one regular expression so that
+        each name is searched once, whatever the number of patterns.
+
+        Input: dictionary with the patterns as keys and any value (e.g. the
+        new parameter of a rule)
+
+        Output: list of (PARAMETER block, value of the matching pattern) in
+        the order of the file
+        '''
+        if not patterns:
+            return []
+        # Longest patterns first so that the most specific one is reported
+        ordered = sorted(patterns, key=len, reverse=True)
+        regex = re.compile("|".join(re.escape(p) for p in ordered))
+        found = []
+        for block in self.blocks("PARAMETER"):
+            name = block.name
+            if name is None:
+                continue
+            m = regex.search(name)
+            if m is not None:
+                found.append((block, patterns[m.group(0)]))
+        return found
+
+    def text(self):
+        return "".join(self.lines())
+
+    def write(self, file_name):
+        with io.open(file_name, "w", encoding=ENCODING, newline="") as f:
+            for line in self.lines():
+                f.write(line)
+
+
+def parse_par(lines):
+    '''
+    Parses the lines of a .par file (with their line endings) into a ParFile
+
+    An NI_END line closes the innermost open block. Lines outside of any
+    block are kept in the root of the file.
+    '''
+    par = ParFile()
+    stack = [par]
+    for raw in lines:
+        words = raw.split()
+        if len(words) >= 1 and words[0] == "NI_BEGIN":
+            block = ParBlock(words[1] if len(words) > 1 else "", raw)
+            stack[-1].items.append(block)
+            stack.append(block)
+        elif len(words) >= 1 and words[0] == "NI_END" and len(stack) > 1:
+            stack.pop().end = raw
+        else:
+            stack[-1].items.append(ParLine(raw))
+    par.index_parameters()
+    return par
+
+
+def read_par(file_name):
+    '''Reads and parses a .par file'''
+    with io.open(file_name, "r", encoding=ENCODING, newline="") as f:
+        return parse_par(f)
+
+
+def new_parameter(name, value, value_min, value_max):
+    '''
+    Creates the PARAMETER block of a new user parameter, e.g.
+
+    NI_BEGIN	 PARAMETER
+    NAME	GAP_UNCERTAINTY
+    ...
+    NI_END	 PARAMETER
+    '''
+    block = ParBlock("PARAMETER", "NI_BEGIN\t PARAMETER\n")
+    for key, val in (("NAME", name),
+                     ("LIMIT_MIN", " -1000000000"),
+                     ("LIMIT_MAX", " 1000000000"),
+                     ("VALUE", value),
+                     ("VALUE_MIN", value_min),
+                     ("VALUE_MAX", value_max),
+                     ("VALUE_REF", " 1"),
+                     ("NB_LEVELS", " +2"),
+                     ("QUANTITY_TYPE", " VALUE"),
+                     ("UNCERTAIN", " FALSE")):
+        block.items.append(ParLine("%s\t%s\n" % (key, val)))
+    block.end = "NI_END\t PARAMETER\n"
+    return block
+
+
+def make_expressions(par, expressions, ranges):
+    '''
+    Adds new user parameters and turns the existing parameters into
+    expressions of them
+
+    For each new parameter, every existing PARAMETER whose NAME contains one
+    of its patterns gets QUANTITY_TYPE EXPRESSION and the expression
+    "<VALUE>*<new parameter>". The new parameters are added at the start of
+    the USER_PARAMETERS block and NUMBER_OF_PARAMETERS is updated.
+
+    Parameters that already exist and expressions that are already set are
+    left unchanged, so applying the same rules twice changes nothing. The new
+    parameters themselves are never turned into expressions, even when a
+    pattern is part of their name.
+
+    Input: parsed .par file, dictionary {new parameter: [patterns]},
+    dictionary {new parameter: [value, value_min, value_max]}
+
+    Output: list of (parameter name, change) of the changed parameters
+    '''
+    patterns = {}
+    for key in expressions:
+        for pattern in expressions[key]:
+            patterns[pattern] = key
+
+    changes = []
+    for block, key in par.find_parameters(patterns):
+        if block.name in expressions:
+            continue
+        value = block.get("VALUE")
+        expression = '"%s*%s"' % (value, key)
+        if block.get("QUANTITY_TYPE") == "EXPRESSION" and block.get("EXPRESSION") == expression:
+            continue
+        block.set("QUANTITY_TYPE", "EXPRESSION")
+        existing = block.line("EXPRESSION")
+        if existing is not None:
+            existing.set_value(expression)
+        else:
+            block.insert_after("UNCERTAIN", "EXPRESSION", expression)
+        changes.append((block.name, expression))
+
+    user_blocks = list(par.blocks("USER_PARAMETERS"))
+    if not user_blocks:
+        raise ValueError("The .par file has no USER_PARAMETERS block")
+    user = user_blocks[0]
+    new_keys = [key for key in expressions if key not in par.parameters]
+    if not new_keys:
+        return changes
+    counter = user.line("NUMBER_OF_PARAMETERS")
+    position = 0
+    if counter is not None:
+        counter.set_value("+%s" % (int(counter.value) + len(new_keys)))
+        position = user.items.index(counter) + 1
+    for key in new_keys:
+        value, value_min, value_max = ranges[key]
+        par.add_parameter(user, new_parameter(key, value, value_min, value_max), position)
+        position += 1
+        changes.append((key, "new parameter %s [%s, %s]" % (value, value_min, value_max)))
+
+    return changes
+
+
+def replace_file(par, file_name):
+    '''
+    Writes the .par file to a temporary file in the same directory and
+    renames it to file_name, so that the file is never left half written
+    '''
+    tmp_file = "%s.%s.tmp" % (file_name, os.getpid())
+    try:
+        par.write(tmp_file)
+        os.rename(tmp_file, file_name)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def rewrite_expressions(args):
+    '''
+    Applies make_expressions to one .par file in place (process pool worker)
+
+    The file is only written if something changes.
+
+    Input: tuple (file name, expressions, ranges), see make_expressions
+
+    Output: tuple (file name, list of changes, error message or None)
+    '''
+    file_name, expressions, ranges = args
+    try:
+        par = read_par(file_name)
+        changes = make_expressions(par, expressions, ranges)
+        if changes:
+            replace_file(par, file_name)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        return file_name, [], "%s" % e
+    return file_name, changes, None
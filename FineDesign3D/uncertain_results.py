@@ -33,7 +33,14 @@ __license__ = 'MIT'
 ######################################################################
 
 
+import json
 import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import his_file
+import uq_statistics
 
 # The script needs to be run in the computation folder
 current_dir = os.getcwd()
@@ -42,46 +49,184 @@ current_dir = os.getcwd()
 filename = "sample.his"
 design_dir_name = "_design_"
 
-names = []
-try:
-    with open(os.path.join(current_dir, filename), "r") as f:
-        is_name_block = False
-        is_design_block = False
-        count = 0
-        outfile = open("moments_global.dat", "w")
-        for line in f:
-            words = line.split()
-            # Find the names of the Statistical Moments used in the computation
-            if len(words) == 2:
-                    if (str(words[0]) == "NI_BEGIN") and (str(words[1]) == "STATISTICS_NAMES"):
-						is_name_block = True
-						name  = ""
-                    elif (str(words[0]) == "NI_END") and (str(words[1]) == "STATISTICS_NAMES"):
-						names.append(name)
-						is_name_block = False
-						outfile.write("\n")
-                    elif is_name_block == True:
-                        if str(words[0]) == "STATISTICS":
-                            name = str(words[1])
-                            print("Name %s found") % name
-                            outfile.write(name + " ")
-
-            # Find the values for each design iteration
-            if len(words) >= 2:
-                    if (str(words[0]) == "NI_BEGIN") and (str(words[1]) == "DESIGN_SAMPLE"):
-						is_design_block = True
-						values  = []
-                    elif (str(words[0]) == "NI_END") and (str(words[1]) == "DESIGN_SAMPLE"):
-						is_design_block = False
-                    elif is_design_block == True:
-                        if "DESIGN_STATISTICS" in str(words[0]):
-                            values = list(words[1:])
-                        elif str(words[0]) == "SIMULATION_PATH":
-                            if design_dir_name in str(words[1]):
-                                for i in range(len(values)):
-                                    outfile.write(values[i] + " ")
-                                outfile.write("\n")
-    outfile.close()
-except IOError:
+# The moments are written as text in <output_name>.dat and as a NumPy
+# structured array (design, path and one field per moment) in
+# <output_name>.npy, read with his_file.load_samples.
+# Leave empty to use the name of the .his file (sample_moments for sample.his)
+output_name = ""
+
+# Batch mode: read all the .his files found under this directory (e.g. the
+# project directory) with a pool of nb_batch_processes processes. The moments of
+# each .his file are written next to it in <his name>_moments.dat/.npy and
+# the moments of all the computations in batch_output.dat/.npy, with the
+# computation (path of the .his file under batch_dir) as first column.
+# Leave empty to read only filename
+batch_dir = ""
+batch_output = "moments_batch"
+
+# Follow mode for a running computation: the position in the .his file is
+# saved in <output_name>_state.json and the next run of the script only
+# reads the samples written since the last run
+follow = False
+# With the follow mode, check the .his file every poll_interval seconds
+# until Ctrl-C (0 to read it once and exit)
+poll_interval = 0
+
+# Statistics recomputed from the results of the samples of each design (the
+# result files <objective>.<ext> below the design directories of the .his
+# file), written in <output_name>_<objective>_statistics.dat.
+# Leave empty to only extract the moments of the .his file
+objectives = []
+# Quantiles of each objective
+quantiles = [0.05, 0.5, 0.95]
+# Thresholds of the exceedance probabilities, e.g. {"stall_efficiency": 0.9}
+thresholds = {}
+# Bootstrap confidence intervals of the mean, standard deviation and
+# exceedance probability (0 resamples to skip them)
+nb_bootstrap = 1000
+confidence = 0.95
+
+# Number of processes of the bootstrap
+nb_processes = 1
+# Number of processes reading the .his files of the batch mode (one per core)
+nb_batch_processes = cpu_count()
+
+
+def write_statistics(samples, objective):
+    '''
+    Writes the statistics of the objective for each design of the samples,
+    with the bootstrap confidence intervals
+    '''
+    design_dirs = []
+    designs = []
+    skipped = set()
+    for row in samples:
+        path = row["path"].decode("latin-1")
+        if not os.path.isabs(path):
+            path = os.path.join(current_dir, path)
+        folder = uq_statistics.design_dir(path, design_dir_name)
+        if folder is None or folder in design_dirs or folder in skipped:
+            continue
+        if not os.path.isdir(folder):
+            skipped.add(folder)
+            print("[Warning] Design %s skipped, the directory %s does not exist" % (row["design"], folder))
+            continue
+        design_dirs.append(folder)
+        designs.append(row["design"])
+    values = uq_statistics.sample_values(design_dirs, objective)
+    stats = uq_statistics.statistics(values, quantiles, thresholds.get(objective))
+    names = ["n", "mean", "std"] + ["q%s" % q for q in quantiles]
+    if objective in thresholds:
+        names.append("p_exceed")
+    columns = [stats[n] for n in names]
+    if nb_bootstrap > 0:
+        bounds = uq_statistics.bootstrap(values, nb_bootstrap, confidence, thresholds.get(objective),
+                                         nb_processes=nb_processes)
+        for name in ("mean", "std", "p_exceed"):
+            if name in names:
+                names += [name + "_low", name + "_high"]
+                columns += list(bounds[name])
+    out_name = "%s_%s_statistics.dat" % (output_name, objective)
+    with open(out_name, "w") as outfile:
+        outfile.write("design " + " ".join(names) + "\n")
+        for i in range(len(designs)):
+            outfile.write("%s %s\n" % (designs[i], " ".join("%.10g" % c[i] for c in columns)))
+    print("Statistics of %s for %s designs written in %s" % (objective, len(designs), out_name))
+
+
+def write_outputs(follower, new_samples):
+    '''
+    Appends the new samples to the .dat file (rewritten if all the samples
+    are new) and saves the .npy file and the state of the follower
+    '''
+    samples = follower.array()
+    his_file.write_moments(output_name + ".dat", new_samples, len(new_samples) < len(samples))
+    his_file.save_samples(output_name + ".npy", samples)
+    if follow:
+        tmp_file = "%s_state.json.%s.tmp" % (output_name, os.getpid())
+        with open(tmp_file, "w") as f:
+            json.dump(follower.state(), f)
+        os.rename(tmp_file, output_name + "_state.json")
+
+
+def run_batch():
+    '''
+    Reads all the .his files under batch_dir in parallel and merges their
+    moments in one table
+    '''
+    his_files = []
+    for folder, subfolders, files in os.walk(batch_dir):
+        subfolders.sort()
+        his_files += [os.path.join(folder, f) for f in sorted(files) if f.endswith(".his")]
+    if not his_files:
+        print("[Error] No .his file found in %s" % batch_dir)
+        sys.exit()
+    print("%s .his files found in %s" % (len(his_files), batch_dir))
+
+    jobs = [(f, design_dir_name, os.path.splitext(f)[0] + "_moments") for f in his_files]
+    pool = Pool(max(1, min(nb_batch_processes, len(jobs))))
+    try:
+        sample_arrays = pool.map(his_file.process_his, jobs, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    computations = [os.path.splitext(os.path.relpath(f, batch_dir))[0] for f in his_files]
+    for computation, samples in zip(computations, sample_arrays):
+        print("%s: %s design samples" % (computation, len(samples)))
+    merged = his_file.merge_samples(computations, sample_arrays)
+    names = his_file.statistics_names(merged)
+    with open(batch_output + ".dat", "w") as outfile:
+        outfile.write("computation design " + " ".join(names) + "\n")
+        for row in merged:
+            outfile.write("%s %s %s\n" % (row["computation"].decode("latin-1"), row["design"],
+                                          " ".join(his_file.format_value(row[n]) for n in names)))
+    his_file.save_samples(batch_output + ".npy", merged)
+    print("%s design samples written in %s.dat and %s.npy" % (len(merged), batch_output, batch_output))
+
+
+if batch_dir:
+    run_batch()
+    sys.exit()
+
+if not output_name:
+    output_name = os.path.splitext(filename)[0] + "_moments"
+
+his_path = os.path.join(current_dir, filename)
+if not os.path.isfile(his_path):
     print("[Error] The files does not exist")
     print("[Error] The program will exit")
+    sys.exit()
+
+state = None
+samples = None
+if follow and os.path.isfile(output_name + "_state.json") and os.path.isfile(output_name + ".npy"):
+    with open(output_name + "_state.json", "r") as f:
+        state = json.load(f)
+    if state["file"] == his_path:
+        samples = his_file.load_samples(output_name + ".npy")
+        print("Continuing %s after %s samples" % (filename, len(samples)))
+    else:
+        state = None
+follower = his_file.HisFollower(his_path, design_dir_name, state=state, samples=samples)
+
+new_samples = follower.poll()
+if state is None:
+    for name in his_file.statistics_names(new_samples):
+        print("Name %s found" % name)
+write_outputs(follower, new_samples)
+print("%s design samples written in %s.dat and %s.npy" % (len(follower.array()), output_name, output_name))
+
+for objective in objectives:
+    write_statistics(follower.array(), objective)
+
+if follow and poll_interval > 0:
+    try:
+        while True:
+            time.sleep(poll_interval)
+            new_samples = follower.poll()
+            if len(new_samples):
+                write_outputs(follower, new_samples)
+                print("%s new design samples, %s in total" % (len(new_samples), len(follower.array())))
+    except KeyboardInterrupt:
+        print("Follow mode stopped")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# Copyright (c) 2018 Thanos Poulos
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+__version__ = '0.1'
+__author__ = 'Thanos Poulos'
+__license__ = 'MIT'
+
+######################################################################
+#
+# Statistics of the uncertainty quantification samples of the designs
+# of FINE/Design3D, recomputed from the raw sample results
+#
+# The design directories are taken from the SIMULATION_PATH of the
+# .his file (see his_file.py). Every result file <objective>.<ext>
+# found below a design directory is one sample of the objective for
+# this design. The statistics of all the designs are computed at once
+# on a (designs x samples) array, nan padded.
+#
+######################################################################
+
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from design_results import read_value
+
+
+def design_dir(path, dir_name="_design_"):
+    '''
+    Returns the part of a simulation path up to the design directory, or
+    None if no directory of the path contains dir_name
+    '''
+    items = path.split(os.sep)
+    for i in range(len(items) - 1, -1, -1):
+        if dir_name in items[i]:
+            return os.sep.join(items[:i + 1])
+    return None
+
+
+def sample_values(design_dirs, objective):
+    '''
+    Reads the values of the objective in every sample of the designs
+
+    Output: (designs x samples) array, nan padded for the designs with
+    less samples
+    '''
+    values = []
+    for folder in design_dirs:
+        found = []
+        for sub_folder, subfolders, files in os.walk(folder):
+            subfolders.sort()
+            for filename in sorted(files):
+                if os.path.splitext(filename)[0] == objective:
+                    value = read_value(os.path.join(sub_folder, filename))
+                    if value is not None:
+                        found.append(float(value))
+        values.append(found)
+    table = np.full((len(values), max([len(v) for v in values] + [0])), np.nan)
+    for i, found in enumerate(values):
+        table[i, :len(found)] = found
+    return table
+
+
+def statistics(values, quantiles=(), threshold=None):
+    '''
+    Computes the statistics of each design (row) of values, ignoring nan
+
+    Output: dictionary name -> array with one value per design. The names
+    are n, mean, std, q<quantile> and, if a threshold is given, p_exceed
+    (fraction of the samples above the threshold)
+    '''
+    n = np.sum(~np.isnan(values), axis=1)
+    # The designs without any sample give nan without warnings
+    safe_n = np.maximum(n, 1)
+    mean = np.nansum(values, axis=1) / safe_n
+    deviation = np.where(np.isnan(values), 0.0, values - mean[:, None])
+    std = np.sqrt(np.sum(deviation ** 2, axis=1) / np.maximum(n - 1, 1))
+    mean[n == 0] = np.nan
+    std[n < 2] = np.nan
+    result = {"n": n, "mean": mean, "std": std}
+    for q in quantiles:
+        column = np.full(len(values), np.nan)
+        ok = n > 0
+        if np.any(ok):
+            column[ok] = np.nanpercentile(values[ok], 100.0 * q, axis=1)
+        result["q%s" % q] = column
+    if threshold is not None:
+        p_exceed = np.sum(values > threshold, axis=1) / safe_n.astype(float)
+        p_exceed[n == 0] = np.nan
+        result["p_exceed"] = p_exceed
+    return result
+
+
+def bootstrap_batch(args):
+    '''
+    Statistics of a batch of bootstrap resamples of designs with the same
+    number of samples (process pool worker)
+
+    Input: tuple ((designs x n) array, number of resamples, seed, threshold)
+
+    Output: (designs x resamples) arrays of the mean, the standard deviation
+    and the exceedance probability (nan without threshold)
+    '''
+    data, nb_resamples, seed, threshold = args
+    rng = np.random.RandomState(seed)
+    n = data.shape[1]
+    # Same resampled indices for all the designs: (designs, resamples, n)
+    resampled = data[:, rng.randint(0, n, (nb_resamples, n))]
+    mean = resampled.mean(axis=2)
+    std = resampled.std(axis=2, ddof=1) if n > 1 else np.full(mean.shape, np.nan)
+    if threshold is None:
+        p_exceed = np.full(mean.shape, np.nan)
+    else:
+        p_exceed = (resampled > threshold).mean(axis=2)
+    return mean, std, p_exceed
+
+
+def bootstrap(values, nb_resamples=1000, confidence=0.95, threshold=None, seed=0,
+              batch_size=100, nb_processes=1):
+    '''
+    Bootstrap confidence intervals of the mean, the standard deviation and
+    the exceedance probability of each design (row) of values
+
+    The designs are grouped by number of samples and each group is resampled
+    batch_size resamples at a time as one NumPy array. The batches can be
+    computed by a process pool.
+
+    Output: dictionary name -> (lower bound array, upper bound array), for
+    the names mean, std and p_exceed
+    '''
+    n = np.sum(~np.isnan(values), axis=1)
+    alpha = 100.0 * (1.0 - confidence) / 2.0
+    bounds = dict((name, (np.full(len(values), np.nan), np.full(len(values), np.nan)))
+                  for name in ("mean", "std", "p_exceed"))
+
+    jobs = []
+    groups = []
+    for size in np.unique(n[n > 0]):
+        rows = np.nonzero(n == size)[0]
+        # The nan padding is at the end of the rows
+        data = values[rows, :size]
+        starts = range(0, nb_resamples, batch_size)
+        for start in starts:
+            jobs.append((data, min(batch_size, nb_resamples - start), seed + len(jobs), threshold))
+        groups.append((rows, len(starts)))
+
+    if nb_processes > 1 and len(jobs) > 1:
+        pool = Pool(nb_processes)
+        try:
+            results = pool.map(bootstrap_batch, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [bootstrap_batch(job) for job in jobs]
+
+    first = 0
+    for rows, nb_batches in groups:
+        batches = results[first:first + nb_batches]
+        first += nb_batches
+        for k, name in enumerate(("mean", "std", "p_exceed")):
+            resampled = np.concatenate([b[k] for b in batches], axis=1)
+            if np.all(np.isnan(resampled)):
+                continue
+            bounds[name][0][rows] = np.percentile(resampled, alpha, axis=1)
+            bounds[name][1][rows] = np.percentile(resampled, 100.0 - alpha, axis=1)
+    return bounds
@@ -31,6 +31,142 @@ import string
 import shutil
 import subprocess
 from datetime import datetime
+import hashlib
+import tarfile
+import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
+
+# Verify the backup against the project files before anything is deleted
+verify_backup = True
+# Number of threads used to hash the files
+hash_threads = 8
+# Size of the chunks read when hashing (bytes)
+chunk_size = 1024*1024
+
+
+def hash_stream(stream):
+	'''
+	Returns the sha256 digest of an open file object read in chunks
+	'''
+	h = hashlib.sha256()
+	chunk = stream.read(chunk_size)
+	while chunk:
+		h.update(chunk)
+		chunk = stream.read(chunk_size)
+	return h.hexdigest()
+
+
+def hash_file(file_path):
+	'''
+	Returns the sha256 digest of a file
+	'''
+	with open(file_path, 'rb') as f:
+		return hash_stream(f)
+
+
+def strip_top_folder(member_name):
+	'''
+	Removes the backup folder name from an archive member name
+	'''
+	parts = member_name.replace('\\', '/').strip('/').split('/', 1)
+	if len(parts) == 1:
+		return None
+	return os.path.normpath(parts[1])
+
+
+def hash_tar_members(archive):
+	'''
+	Hashes all the members of a .tar.gz archive in one pass
+	The archive is read sequentially (gzip stream) while the pool hashes the sources
+	'''
+	digests = {}
+	with tarfile.open(archive, 'r:gz') as tar:
+		for member in tar:
+			name = strip_top_folder(member.name)
+			if member.isfile() and name:
+				digests[name] = hash_stream(tar.extractfile(member))
+	return digests
+
+
+def hash_zip_member(args):
+	'''
+	Hashes one member of a .zip archive. Each call opens its own handle
+	so that the members can be hashed in parallel
+	'''
+	archive, member_name = args
+	with zipfile.ZipFile(archive, 'r') as z:
+		with z.open(member_name) as member:
+			return hash_stream(member)
+
+
+def verify_backup_files(source_dir, backup_dir, archive=None):
+	'''
+	Compares the files of the backup folder (or of the archive, if given) with
+	the project files they were copied from. All hashing is done in a thread pool
+	so that reading and hashing of different files overlap.
+	A checksum manifest (sha256sum format) is written next to the backup.
+
+	Returns True if every file matches. An archive that cannot be read
+	(missing, truncated or corrupt) is a verification failure
+	'''
+	print ' > Verifying the backup checksums'
+	rel_paths = []
+	for folder, subfolder, files in os.walk(backup_dir):
+		for name in files:
+			rel_paths.append(os.path.relpath(os.path.join(folder, name), backup_dir))
+	rel_paths.sort()
+
+	pool = ThreadPool(hash_threads)
+	try:
+		if archive is not None and not os.path.isfile(archive):
+			raise IOError('archive not found: ' + archive)
+		source_job = pool.map_async(hash_file, [os.path.join(source_dir, p) for p in rel_paths])
+		if archive is None:
+			copy_job = pool.map_async(hash_file, [os.path.join(backup_dir, p) for p in rel_paths])
+		elif archive.endswith('.zip'):
+			with zipfile.ZipFile(archive, 'r') as z:
+				members = [m for m in z.namelist() if not m.endswith('/') and strip_top_folder(m)]
+			zip_job = pool.map_async(hash_zip_member, [(archive, m) for m in members])
+		else:
+			tar_job = pool.apply_async(hash_tar_members, (archive,))
+
+		source_digests = dict(zip(rel_paths, source_job.get()))
+		if archive is None:
+			backup_digests = dict(zip(rel_paths, copy_job.get()))
+		elif archive.endswith('.zip'):
+			backup_digests = dict(zip([strip_top_folder(m) for m in members], zip_job.get()))
+		else:
+			backup_digests = tar_job.get()
+	except (IOError, OSError, EOFError, tarfile.TarError, zipfile.BadZipfile, zlib.error) as e:
+		print ' > Backup verification FAILED'
+		print ' >> cannot read the backup: ' + str(e)
+		return False
+	finally:
+		pool.close()
+		pool.join()
+
+	errors = []
+	for p in rel_paths:
+		if p not in backup_digests:
+			errors.append('missing from backup: ' + p)
+		elif backup_digests[p] != source_digests[p]:
+			errors.append('checksum mismatch: ' + p)
+	for p in sorted(set(backup_digests) - set(source_digests)):
+		errors.append('not in project: ' + p)
+
+	manifest = os.path.basename(os.path.normpath(backup_dir)) + '.sha256'
+	with open(os.path.join(os.path.dirname(os.path.abspath(backup_dir)), manifest), 'w') as m:
+		for p in rel_paths:
+			m.write('%s  %s\n' % (source_digests[p], p))
+
+	if errors:
+		print ' > Backup verification FAILED'
+		for e in errors:
+			print ' >> ' + e
+		return False
+	print ' > Backup verified: '+str(len(rel_paths))+' files, manifest written in '+manifest
+	return True
 
 
 print ''
@@ -96,14 +232,30 @@ else:
 			os.unlink(os.path.join(mesh_dir,files))
 
 	os.chdir(os.path.expanduser('../..'))
+	archive = None
+	status = 0
 	if archive_tmp == '0' and compress_q == 'y':
-		os.system('tar cvfz '+backup_file+'.tar.gz '+ backup_file)
+		status = os.system('tar cvfz '+backup_file+'.tar.gz '+ backup_file)
+		archive = backup_file+'.tar.gz'
 	elif archive_tmp == '1' and compress_q == 'y':
 		command =  "zip -r %s %s/" % (backup_file,backup_file)
 		#subprocess.call(command)
-		os.system(command)
+		status = os.system(command)
+		archive = backup_file+'.zip'
+
+	# Check the backup before deleting anything
+	verified = True
+	if status != 0:
+		print ' > The compression of '+backup_file+' FAILED (exit status '+str(status)+')'
+		verified = False
+	elif verify_backup:
+		verified = verify_backup_files(os.getcwd(), backup_file, archive)
+
 	if delete == 'y':
-		os.system('rm -fr '+backup_file)
+		if verified:
+			os.system('rm -fr '+backup_file)
+		else:
+			print ' > The backup folder '+backup_file+' is kept because the verification failed'
 
 
 
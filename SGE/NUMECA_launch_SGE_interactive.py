@@ -44,6 +44,8 @@ __license__ = 'MIT'
 # 2017-08-07: Updated to latest local IntelMPI version for FT 12.1 and FO 7.1
 # 2017-08-08: Fixed a bug that made the script go into an infinite loop in case the input for the parallel partitioner is bad (FT)
 # 2017-08-08: Adapted the regular expression to include patches (e.g. 112_2)
+# 2026-10-19: Added the submission of all the computations as one SGE array job (qsub -t)
+# 2026-10-19: Computations are found in one scandir pass, cached in ~/.numeca/ with the directory modification times
 
 #------------- To Do -------------#
 # TO DO: Dependency definition --> Probably too complex for a command line, maybe a GUI is needed
@@ -60,6 +62,29 @@ import sys
 import subprocess
 import shutil
 import re
+import json
+import time
+
+# os.scandir exists from Python 3.5, the scandir package provides it before
+try:
+	from os import scandir
+except ImportError:
+	try:
+		from scandir import scandir
+	except ImportError:
+		scandir = None
+
+# Cache of the computations found in each project directory. A computation
+# directory is only read again when its modification time changes (a file
+# was added, removed or renamed). The sizes and times of the mesh and result
+# files are not cached, they are read for the selected computations only
+discovery_cache_file = os.path.join(os.path.expanduser("~"), ".numeca", "sge_computations_cache.json")
+
+# Extensions of the files giving a hint of the mesh size (sum of their sizes)
+# and of the result files giving the time of the last result (the .cgns file
+# of a computation directory is the FINE/Turbo solution)
+mesh_extensions = (".igg", ".bcs", ".dom")
+result_extensions = (".res", ".mf", ".std", ".cgns")
 
 #---------------------------------------------------------
 #
@@ -114,7 +139,153 @@ def major_version(version):
 	return version_float
 
 
-def write_numeca_settings(path, name, index, version, package, cores, sge):
+def list_dir(path):
+	"""
+	Function that lists a directory, using scandir when available
+
+	inputs:
+		- path:               directory to list
+
+	outputs:
+		- list of (name, is directory, stat function) of the entries
+	"""
+	entries = []
+	if scandir is not None:
+		for entry in scandir(path):
+			entries.append((entry.name, entry.is_dir(), entry.stat))
+	else:
+		for name in os.listdir(path):
+			full_path = os.path.join(path, name)
+			entries.append((name, os.path.isdir(full_path), lambda p=full_path: os.stat(p)))
+	return entries
+
+
+def scan_computation(path, name):
+	"""
+	Function that reads a computation directory
+
+	inputs:
+		- path:               project path
+		- name:               computation name (directory name)
+
+	outputs:
+		- dictionary with the .run files, the presence of <name>.steering
+		  and the names of the mesh and result files
+	"""
+	info = {"runs": [], "steering": False, "mesh_files": [], "result_files": []}
+	for filename, is_dir, stat in list_dir(os.path.join(path, name)):
+		if is_dir:
+			continue
+		extension = os.path.splitext(filename)[1]
+		if extension == ".run":
+			info["runs"].append(filename)
+		elif filename == name + ".steering":
+			info["steering"] = True
+		if extension in mesh_extensions:
+			info["mesh_files"].append(filename)
+		if extension in result_extensions:
+			info["result_files"].append(filename)
+	return info
+
+
+def computation_file_times(path, name, info):
+	"""
+	Function that reads the current size of the mesh files and time of the
+	result files of a computation. These files are rewritten in place while
+	the computation runs, so they are read on every call and never cached.
+
+	inputs:
+		- path:               project path
+		- name:               computation name (directory name)
+		- info:               dictionary of the computation (see scan_computation)
+
+	outputs:
+		- mesh size hint (bytes) and time of the last result (0 if none)
+	"""
+	mesh_size = 0
+	last_result = 0
+	for filename in info["mesh_files"]:
+		try:
+			mesh_size += os.stat(os.path.join(path, name, filename)).st_size
+		except OSError:
+			pass
+	for filename in info["result_files"]:
+		try:
+			last_result = max(last_result, os.stat(os.path.join(path, name, filename)).st_mtime)
+		except OSError:
+			pass
+	return mesh_size, last_result
+
+
+def load_discovery_cache():
+	"""
+	Function that reads the computation cache file. An empty dictionary is
+	returned if the cache does not exist or is unreadable
+	"""
+	try:
+		with open(discovery_cache_file, 'r') as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return {}
+
+
+def save_discovery_cache(cache):
+	"""
+	Function that writes the computation cache file. It is written to a
+	temporary name and renamed, so that an interrupted run does not leave a
+	broken cache behind
+	"""
+	cache_dir = os.path.dirname(discovery_cache_file)
+	try:
+		if not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir)
+		tmp_file = "%s.%s.tmp" %(discovery_cache_file, os.getpid())
+		with open(tmp_file, 'w') as f:
+			json.dump(cache, f)
+		os.rename(tmp_file, discovery_cache_file)
+	except (IOError, OSError):
+		print (">: The computation cache %s could not be written" %(discovery_cache_file))
+
+
+def discover_computations(path):
+	"""
+	Function that finds the computations of a project directory in one pass.
+	The project directory is listed once and each computation directory is
+	only read if its modification time differs from the cached one. Only the
+	file names are cached, the sizes and times are read with
+	computation_file_times.
+
+	inputs:
+		- path:               project path
+
+	outputs:
+		- computations:       dictionary computation name -> dictionary (see scan_computation)
+		- files:              names of the files of the project directory
+	"""
+	path = os.path.abspath(path)
+	cache = load_discovery_cache()
+	cached = cache.get(path, {}).get("computations", {})
+	computations = {}
+	files = []
+	changed = False
+	for name, is_dir, stat in list_dir(path):
+		if not is_dir:
+			files.append(name)
+			continue
+		mtime = stat().st_mtime
+		info = cached.get(name)
+		if info is None or info.get("mtime") != mtime or "result_files" not in info:
+			info = scan_computation(path, name)
+			info["mtime"] = mtime
+			changed = True
+		computations[name] = info
+	if changed or set(computations) != set(cached):
+		cache[path] = {"computations": computations}
+		save_discovery_cache(cache)
+	return computations, sorted(files)
+
+
+def write_numeca_settings(path, name, index, version, package, cores, sge, task_list=None):
 	"""
 	Function that writes the NUMECA settings in the sge files
 
@@ -126,22 +297,44 @@ def write_numeca_settings(path, name, index, version, package, cores, sge):
 		- package: 			software type (FINE/Turbo, FINE/Open, etc)
 		- cores:            Number of cores used for the job
 		- sge:				file object to write
+		- task_list:        computations of an array job (task $SGE_TASK_ID runs
+		                    the computation at this position) or None for a
+		                    single computation
 
 	outputs:
 		- The function has no outputs
 	"""
-    
+
 	sge.write("#!/bin/sh\n")
 	sge.write("#$ -S /bin/sh\n")
 	sge.write("#$ -notify\n")
 	sge.write("#$ -q compute.q\n")
 	sge.write("#$ -pe orte %s\n" %(cores))
 	sge.write("#$ -l exclusive=1\n")
-	sge.write("#$ -N %s_%s\n" %(package.upper(),index))
-	if package == "hh":
-		sge.write("#$ -o %s.std -j y\n" %(os.path.join(path,name[index])))
+	if task_list is not None:
+		# Output of the task until the computation is known
+		sge.write("#$ -N %s_array\n" %(package.upper()))
+		sge.write("#$ -o %s.$TASK_ID.std -j y\n" %(os.path.join(path,"SGE_Scripts","%s_array" %(package))))
+		sge.write("\n")
+		# The list is part of the script, which qsub spools, so a later
+		# submission cannot change the computations of the queued tasks
+		sge.write("# Computation of this task\n")
+		sge.write("case $SGE_TASK_ID in\n")
+		for k in range(len(task_list)):
+			sge.write("\t%s) COMPUTATION=\"%s\" ;;\n" %(k + 1, task_list[k]))
+		sge.write("esac\n")
+		sge.write("\n")
+		# Same output file as a single job of the computation
+		if package == "hh":
+			sge.write("exec > %s.std 2>&1\n" %(os.path.join(path,"${COMPUTATION}")))
+		else:
+			sge.write("exec > %s.std 2>&1\n" %(os.path.join(path,"${COMPUTATION}","${COMPUTATION}")))
 	else:
-		sge.write("#$ -o %s.std -j y\n" %(os.path.join(path,name[index],name[index])))
+		sge.write("#$ -N %s_%s\n" %(package.upper(),index))
+		if package == "hh":
+			sge.write("#$ -o %s.std -j y\n" %(os.path.join(path,name[index])))
+		else:
+			sge.write("#$ -o %s.std -j y\n" %(os.path.join(path,name[index],name[index])))
 	sge.write("\n")
 
 	# Write Numeca settings
@@ -183,44 +376,44 @@ def write_ld_library(sge, mpi_version, version_float, package):
 	sge.write("#########################################################################\n")
 	sge.write("# PATH - LD_LIBRARY_PATH\n")
 	sge.write("#########################################################################\n\n\n")
-	
+
 	if mpi_version == "impi":
-        	if version_float >= 12:
+		if version_float >= 12:
 			sge.write('pathlist="${I_MPI_ROOT}/bin64"\n')
 		else:
 			sge.write('pathlist="${I_MPI_ROOT}/bin"\n')
-        else:
-        	sge.write('pathlist="${MPIR_HOME}/bin ${NI_VERSIONS_DIR}/bin"\n')
-	
+	else:
+		sge.write('pathlist="${MPIR_HOME}/bin ${NI_VERSIONS_DIR}/bin"\n')
+
 	sge.write("for item in ${pathlist} ; do\n")
 	sge.write('\tif [ -n "$PATH" ] ; then\n')
-    sge.write("\t\tfound=`echo :${PATH}: | grep :${item}:`\n")
-    sge.write('\t\tif [ "X$found" == "X" ] ; then\n')
-    sge.write('\t\t\tPATH="${item}:${PATH}"\n')
-    sge.write("\t\tfi\n")
-    sge.write("\telse\n")
-    sge.write("\t\tPATH=${item}\n")
-    sge.write("\tfi\n")
+	sge.write("\t\tfound=`echo :${PATH}: | grep :${item}:`\n")
+	sge.write('\t\tif [ "X$found" == "X" ] ; then\n')
+	sge.write('\t\t\tPATH="${item}:${PATH}"\n')
+	sge.write("\t\tfi\n")
+	sge.write("\telse\n")
+	sge.write("\t\tPATH=${item}\n")
+	sge.write("\tfi\n")
 	sge.write("done\n")
 	sge.write("export PATH\n")
-	
+
 	if mpi_version == "impi":
-        	if (package == "ft" and version_float >= 12) or (package == "fo" and version_float >= 7):
-                sge.write('libpath="${I_MPI_ROOT}/lib64 ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
-        	elif (package == "ft" and version_float < 12) or (package == "fo" and version_float < 7):
-            	sge.write('libpath="${I_MPI_ROOT}/lib ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
-    	else:
-        	sge.write('libpath="${MPIR_HOME}/lib ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
-	
+		if (package == "ft" and version_float >= 12) or (package == "fo" and version_float >= 7):
+			sge.write('libpath="${I_MPI_ROOT}/lib64 ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
+		elif (package == "ft" and version_float < 12) or (package == "fo" and version_float < 7):
+			sge.write('libpath="${I_MPI_ROOT}/lib ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
+	else:
+		sge.write('libpath="${MPIR_HOME}/lib ${NUMECA_BIN}/_lib_sicc15 ${NUMECA_BIN}/_lib_sx86_64 ${NUMECA_BIN}/_lib_sx86_64dtk ${NUMECA_BIN}/install/flex64"\n\n')
+
 	sge.write("for item in ${libpath} ; do\n")
-    sge.write('\tif [ -n "$LD_LIBRARY_PATH" ] ; then\n')
-    sge.write('\t\tfound=`echo :${LD_LIBRARY_PATH}: | grep :${item}:`\n')
-    sge.write('\t\tif [ "X$found" == "X" ] ; then\n')
-    sge.write('\t\t\tLD_LIBRARY_PATH="${item}:${LD_LIBRARY_PATH}"\n')
-    sge.write("\t\tfi\n")
-    sge.write("\telse\n")
-    sge.write("\t\tLD_LIBRARY_PATH=${item}\n")
-    sge.write("\tfi\n")
+	sge.write('\tif [ -n "$LD_LIBRARY_PATH" ] ; then\n')
+	sge.write('\t\tfound=`echo :${LD_LIBRARY_PATH}: | grep :${item}:`\n')
+	sge.write('\t\tif [ "X$found" == "X" ] ; then\n')
+	sge.write('\t\t\tLD_LIBRARY_PATH="${item}:${LD_LIBRARY_PATH}"\n')
+	sge.write("\t\tfi\n")
+	sge.write("\telse\n")
+	sge.write("\t\tLD_LIBRARY_PATH=${item}\n")
+	sge.write("\tfi\n")
 	sge.write("done\n")
 	sge.write("export LD_LIBRARY_PATH\n")
 	sge.write("\n")
@@ -239,7 +432,7 @@ def write_mpi_settings(mpi_version, version_float, package, sge):
 	outputs:
 		- The function has no outputs
 	"""
-	
+
 	# Write MPI library settings
 	if mpi_version == "impi":
 		# Write IntelMPI settings
@@ -247,7 +440,7 @@ def write_mpi_settings(mpi_version, version_float, package, sge):
 		sge.write("# INTELMPI Library Settings                                             #\n")
 		sge.write("#########################################################################\n")
 		sge.write("\n")
-	
+
 		# Add this if the version is older than 12.1
 		if (package == "ft" and version_float < 12) or (package == "fo" and version_float < 7):
 			sge.write("I_MPI_ROOT=$NUMECA_BIN/_mpi/_impi5.0.3/intel64\n")
@@ -265,37 +458,37 @@ def write_mpi_settings(mpi_version, version_float, package, sge):
 		sge.write("I_MPI_FABRICS=ofa\n")
 		sge.write("export I_MPI_FABRICS\n\n")
 		sge.write("export I_MPI_MPIRUN_CLEANUP=1\n\n")
-		
+
 		if package == "ft":
-            	sge.write("BIN=$NUMECA_DIR/LINUX/euranus/euranusTurbodpx86_64_impi_icc\n\n")
-        	else:
-            	sge.write("BIN=$NUMECA_DIR/LINUX/hexa/hexstreamdpx86_64_impi_icc\n\n")
+			sge.write("BIN=$NUMECA_DIR/LINUX/euranus/euranusTurbodpx86_64_impi_icc\n\n")
+		else:
+			sge.write("BIN=$NUMECA_DIR/LINUX/hexa/hexstreamdpx86_64_impi_icc\n\n")
 	else:
 		# Write OpenMPI settings
 		sge.write("#########################################################################\n")
 		sge.write("# OPENMPI Library Settings                                              #\n")
 		sge.write("#########################################################################\n")
 		sge.write("\n")
-		
+
 		# Check if the version is 12.1 or newer
 		if (package == "ft" and version_float >= 12) or (package == "fo" and version_float >= 7):
 			sge.write("MPIR_HOME=/XF/Mpi/Openmpi/1.10.4.gcc-4.8.5/Installed/\n")
 		else:
 			sge.write("MPIR_HOME=/XF/Mpi/Openmpi/1.6.5/Installed/\n")
-        
+
 		sge.write("export MPIR_HOME\n\n")
 		sge.write("export OPAL_PREFIX=$MPIR_HOME\n")
 		sge.write("ompi_options=\n")
-		
+
 		if version_float >= 12 and package == "ft":
 			sge.write("BIN=${NUMECA_BIN}/euranus/euranusTurbodpx86_64_ompi_icc\n\n")
 		elif version_float < 12 and package == "ft":
 			sge.write("BIN=${NUMECA_BIN}/euranus/euranusTurbodpx86_64_ompi\n\n")
-        	elif package == "fo":
-            	sge.write("BIN=${NUMECA_BIN}/hexa/hexstreamdpx86_64_ompi\n\n")
-        	elif package == "hh":
-            	sge.write("export BIN=${NUMECA_BIN}/hexpress/hexpresshybridx86_64\n\n")
-            	sge.write("unset OMP_NUM_THREADS\n")
+		elif package == "fo":
+			sge.write("BIN=${NUMECA_BIN}/hexa/hexstreamdpx86_64_ompi\n\n")
+		elif package == "hh":
+			sge.write("export BIN=${NUMECA_BIN}/hexpress/hexpresshybridx86_64\n\n")
+			sge.write("unset OMP_NUM_THREADS\n")
 
 
 def write_computation_settings(path, name, index, mpi_version, version_float, package, sge, mem=None, parpar=None):
@@ -317,50 +510,50 @@ def write_computation_settings(path, name, index, mpi_version, version_float, pa
 		- The function has no outputs
 
 	"""
-	
+
 	# Write computation settings
-    sge.write("#########################################################################\n")
+	sge.write("#########################################################################\n")
 	sge.write("# Computation Settings & Start                                          #\n")
 	sge.write("#########################################################################\n")
 	sge.write("\n")
 	if package == "hh":
-        # Old command, could be useful to keep it here
+		# Old command, could be useful to keep it here
 		#sge.write('COMMAND="${MPIR_HOME}/bin/mpirun  --display-map --display-allocation ${ompi_options} -np ${NB_PROCS} ${BIN} < %s"\n' %(os.path.join(path,name[index])))
 		sge.write("CONF_FILE=%s\n" %(os.path.join(path,name[index])))
 		sge.write("$BIN ${CONF_FILE} -numproc ${NSLOTS} -print")
 		sge.write("\n")
 		sge.write("$COMMAND")
 		sge.close()
-    	else:
-        	sge.write("RUNFILE=%s.run\n" %(os.path.join(path,name[index],name[index])))
-        	sge.write("\n")
-        	sge.write("STEERINGFILE=%s.steering\n" %(os.path.join(path,name[index],name[index])))
-        	sge.write("\n")
-
-        	# Check if the parallel partitioner should be used and if the automatic memory estimation will be used
-        	if package == "ft":
+	else:
+		sge.write("RUNFILE=%s.run\n" %(os.path.join(path,name[index],name[index])))
+		sge.write("\n")
+		sge.write("STEERINGFILE=%s.steering\n" %(os.path.join(path,name[index],name[index])))
+		sge.write("\n")
+
+		# Check if the parallel partitioner should be used and if the automatic memory estimation will be used
+		if package == "ft":
 			sge.write("NB_BALANCE=`expr $NSLOTS - 1`\n")
-                	sge.write("\n")
-            		if mem[0] == "1":
-                		if parpar == "1":
-                            sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -partition -computation $RUNFILE -nproc $NB_BALANCE -nbint %s -nbreal %s\n" %(mem[1],mem[2]))
-                		else:
-                            sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -parallel -computation $RUNFILE -nproc $NB_BALANCE -nbint %s -nbreal %s\n" %(mem[1],mem[2]))
-            		else:
-                		if parpar == "1":
-              				sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -partition -computation $RUNFILE -nproc $NB_BALANCE\n")
-                		else:
-               				sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -parallel -computation $RUNFILE -nproc $NB_BALANCE\n")
-            		sge.write("\n")
-        
-        	# Different commands are needed for OpemMPI and IntelMPI
-        	if mpi_version == "ompi":
-                sge.write("${MPIR_HOME}/bin/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
-        	else:
-            	if (package == "ft" and version_float >= 12) or (package == "fo" and version_float >= 7):
-                	sge.write("${I_MPI_ROOT}/bin64/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
-            	else:
-                	sge.write("${I_MPI_ROOT}/bin/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
+			sge.write("\n")
+			if mem[0] == "1":
+				if parpar == "1":
+					sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -partition -computation $RUNFILE -nproc $NB_BALANCE -nbint %s -nbreal %s\n" %(mem[1],mem[2]))
+				else:
+					sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -parallel -computation $RUNFILE -nproc $NB_BALANCE -nbint %s -nbreal %s\n" %(mem[1],mem[2]))
+			else:
+				if parpar == "1":
+					sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -partition -computation $RUNFILE -nproc $NB_BALANCE\n")
+				else:
+					sge.write("fine${NUMECA_SOFT_VERSION} -print -batch -parallel -computation $RUNFILE -nproc $NB_BALANCE\n")
+			sge.write("\n")
+
+		# Different commands are needed for OpemMPI and IntelMPI
+		if mpi_version == "ompi":
+			sge.write("${MPIR_HOME}/bin/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
+		else:
+			if (package == "ft" and version_float >= 12) or (package == "fo" and version_float >= 7):
+				sge.write("${I_MPI_ROOT}/bin64/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
+			else:
+				sge.write("${I_MPI_ROOT}/bin/mpirun -np $NSLOTS $BIN $RUNFILE -steering $STEERINGFILE -print\n")
 
 
 def submit_job(name, index, script_path):
@@ -376,15 +569,51 @@ def submit_job(name, index, script_path):
 	""" 
 	print ("Launching computation: %s" %(name[index]))
 
-    # Check python version and launch the appropriate command
-    if sys.version_info[:2] <= (2, 7):
-       	command_line = "qsub " + os.path.join(script_path, "launch_%s.sge" %(name[index]))
-       	os.system(command_line)
-    else:
-       	subprocess.call(["qsub",os.path.join(script_path, "launch_%s.sge" %(name[index]))])
+	# Check python version and launch the appropriate command
+	if sys.version_info[:2] <= (2, 7):
+		command_line = "qsub " + os.path.join(script_path, "launch_%s.sge" %(name[index]))
+		os.system(command_line)
+	else:
+		subprocess.call(["qsub",os.path.join(script_path, "launch_%s.sge" %(name[index]))])
+
+
+def sge_scripts(name, package, array_job):
+	"""
+	Function that returns the computation names and the SGE scripts to write.
+	An array job has a single script, whose computation name is the
+	${COMPUTATION} variable set from the task list written in the script.
+
+	outputs:
+		- names:              Computation names used in the scripts (list)
+		- files:              SGE script names (list)
+		- task_list:          Computations of the array job or None
+	"""
+	if array_job:
+		return ["${COMPUTATION}"], ["launch_%s_array.sge" %(package)], list(name)
+	return name, ["launch_%s.sge" %(n) for n in name], None
+
 
+def submit_array_job(script_file, nb_tasks, max_running=0):
+	"""
+	Function that submits all the computations with a single qsub
+
+	inputs:
+		- script_file:        SGE script of the array job (string)
+		- nb_tasks:           Number of computations
+		- max_running:        Maximum number of computations running at the same time (0 for no limit)
 
-def launch_fine_turbo(path, name, mpi_version, version, cores, mem, parpar, package, submit):
+	outputs:
+		- The function has no outputs
+	"""
+	command = ["qsub", "-t", "1-%s" %(nb_tasks)]
+	if max_running > 0:
+		command += ["-tc", "%s" %(max_running)]
+	command.append(script_file)
+	print ("Launching %s computations as one array job" %(nb_tasks))
+	subprocess.call(command)
+
+
+def launch_fine_turbo(path, name, mpi_version, version, cores, mem, parpar, package, submit, array_job=False, max_running=0):
 	'''
 	 Function launch_fine_turbo:
 			- This function is used for FINE/Turbo
@@ -397,8 +626,8 @@ def launch_fine_turbo(path, name, mpi_version, version, cores, mem, parpar, pack
 	script_path = os.path.join(path,"SGE_Scripts")
 
 	if not os.path.exists(script_path):
-        print (">: Creating path for SGE scripts...")
-        os.makedirs(script_path)
+		print (">: Creating path for SGE scripts...")
+		os.makedirs(script_path)
 	else:
 		print (">: Path for SGE scripts exists")
 		print (">: Creating SGE script(s)...")
@@ -408,18 +637,21 @@ def launch_fine_turbo(path, name, mpi_version, version, cores, mem, parpar, pack
 	# Define the major version used
 	version_float = major_version(version)
 
-	# Create an SGE script for each computation to launch
-	for i in range(len(name)):
-		with open(os.path.join(script_path, "launch_%s.sge" %(name[i])), 'w') as sge:
-            write_numeca_settings(path, name, i, version, package, cores, sge)
+	# Create an SGE script for each computation to launch (a single one for an array job)
+	names, files, task_list = sge_scripts(name, package, array_job)
+	for i in range(len(names)):
+		with open(os.path.join(script_path, files[i]), 'w') as sge:
+			write_numeca_settings(path, names, i, version, package, cores, sge, task_list)
 			write_mpi_settings(mpi_version, version_float, package, sge)
 			write_ld_library(sge, mpi_version, version_float, package)
-            write_computation_settings(path, name, i, mpi_version, version_float, package, sge, mem, parpar)
-        if submit:
-            submit_job(name, i, script_path)
+			write_computation_settings(path, names, i, mpi_version, version_float, package, sge, mem, parpar)
+		if submit and not array_job:
+			submit_job(names, i, script_path)
+	if submit and array_job:
+		submit_array_job(os.path.join(script_path, files[0]), len(name), max_running)
 
 
-def launch_fine_open(path, name, mpi_version, version, cores, package, submit):
+def launch_fine_open(path, name, mpi_version, version, cores, package, submit, array_job=False, max_running=0):
 	'''
 		 Function launch_fine_open:
 			- This function is used for FINE/Open
@@ -440,23 +672,26 @@ def launch_fine_open(path, name, mpi_version, version, cores, package, submit):
 		print (">: Creating SGE script(s)...")
 
 	os.chdir(script_path)
-	
+
 	# Define the major version used
 	version_float = major_version(version)
 
-	# Create an SGE file for each computation to be launched
-	for i in range(len(name)):
-        	with open(os.path.join(script_path, "launch_%s.sge" %(name[i])), 'w') as sge:
-                write_numeca_settings(path, name, i, version, package, cores, sge)
-            	write_mpi_settings(mpi_version, version_float, package, sge)
-                write_ld_library(sge, mpi_version, version_float, package)
-                write_computation_settings(path, name, i, mpi_version, version_float, package, sge)
-        
-        	if submit:
-                submit_job(name, i, script_path)
+	# Create an SGE file for each computation to be launched (a single one for an array job)
+	names, files, task_list = sge_scripts(name, package, array_job)
+	for i in range(len(names)):
+		with open(os.path.join(script_path, files[i]), 'w') as sge:
+			write_numeca_settings(path, names, i, version, package, cores, sge, task_list)
+			write_mpi_settings(mpi_version, version_float, package, sge)
+			write_ld_library(sge, mpi_version, version_float, package)
+			write_computation_settings(path, names, i, mpi_version, version_float, package, sge)
 
+		if submit and not array_job:
+			submit_job(names, i, script_path)
+	if submit and array_job:
+		submit_array_job(os.path.join(script_path, files[0]), len(name), max_running)
 
-def launch_hexpress_hybrid(path, name, version, cores, package, submit, mpi_version=None):
+
+def launch_hexpress_hybrid(path, name, version, cores, package, submit, mpi_version=None, array_job=False, max_running=0):
 	'''
 		 Function launch_hexpress_hybrid:
 			- This function is used for Hexpress/Hybrid
@@ -477,20 +712,23 @@ def launch_hexpress_hybrid(path, name, version, cores, package, submit, mpi_vers
 		print (">: Creating SGE script(s)...")
 
 	os.chdir(script_path)
-	
+
 	# Define the major version used
 	version_float = major_version(version)
 
-	# Create an SGE file for each computation to be launched
-	for i in range(len(name)):
-        	with open(os.path.join(script_path, "launch_%s.sge" %(name[i])), 'w') as sge:
-            	write_numeca_settings(path, name, i, version, package, cores, sge)
-            	write_ld_library(sge, mpi_version, version_float, package)
-            	write_mpi_settings(mpi_version, version, package, sge)
-            	write_computation_settings(path, name, i, mpi_version, version, package, sge)
-            
-        	if submit:
-            		submit_job(name, i, script_path)
+	# Create an SGE file for each computation to be launched (a single one for an array job)
+	names, files, task_list = sge_scripts(name, package, array_job)
+	for i in range(len(names)):
+		with open(os.path.join(script_path, files[i]), 'w') as sge:
+			write_numeca_settings(path, names, i, version, package, cores, sge, task_list)
+			write_ld_library(sge, mpi_version, version_float, package)
+			write_mpi_settings(mpi_version, version, package, sge)
+			write_computation_settings(path, names, i, mpi_version, version, package, sge)
+
+		if submit and not array_job:
+			submit_job(names, i, script_path)
+	if submit and array_job:
+		submit_array_job(os.path.join(script_path, files[0]), len(name), max_running)
 
 
 #---------------------------------------------------------
@@ -522,6 +760,9 @@ if not(os.path.isdir(computation_path)):
 	print ("!!! The program will exit")
 	raise SystemExit
 
+# Find the computations of the project directory
+project_computations, project_files = discover_computations(computation_path)
+
 # Computation definition
 print (">>> Enter the computations that you would like to run separated with space [default: all computations in the project directory]: ")
 print (">: For FINE/Turbo, FINE/Open and FINE/Marine, enter the computation name")
@@ -530,7 +771,7 @@ computation_names = raw_input()
 
 if software == "hh":
 	if computation_names == "":
-		computation_name_list = [f for f in os.listdir(computation_path) if f.endswith('.conf')]
+		computation_name_list = [f for f in project_files if f.endswith('.conf')]
 	else:
 		computation_name_list = computation_names.split()
 		if not(all(f.endswith('.conf') for f in computation_name_list)):
@@ -538,10 +779,8 @@ if software == "hh":
 			print ("!!! The program will exit")
 			raise SystemExit
 else:
-    	extension = ".run"
-	
-	all_computations = [subdir for subdir in os.walk(computation_path).next()[1] if any(subfile.endswith(extension) for subfile in os.listdir(os.path.join(computation_path,subdir)))]
-	
+	all_computations = sorted(subdir for subdir in project_computations if project_computations[subdir]["runs"])
+
 	if computation_names == "":
 		computation_name_list = all_computations
 	else:
@@ -606,9 +845,21 @@ if software == "ft":
 
 # Ask the user if they would like to submit the jobs
 if raw_input(">>> Would you like to submit the SGE scripts [default: SGE scripts will be submitted] (y/n): ") == "n":
-    	submit = False
+	submit = False
 else:
-    	submit = True
+	submit = True
+
+# Ask the user if the computations should be submitted as one array job (qsub -t)
+array_job = False
+max_running = 0
+if len(computation_name_list) > 1:
+	if raw_input(">>> Would you like to submit the computations as one SGE array job [default: n] (y/n): ") == "y":
+		array_job = True
+		max_running = raw_input(">>> Maximum number of computations running at the same time [default: no limit]: ")
+		while max_running != "" and not max_running.isdigit():
+			print (">: You have to enter a number or nothing for no limit")
+			max_running = raw_input(">>> Maximum number of computations running at the same time [default: no limit]: ")
+		max_running = int(max_running) if max_running else 0
 
 #---------------------------------------------------------
 #
@@ -620,16 +871,27 @@ print (">: SGE files will be created for the following computations:")
 
 if software == "ft" or software == "fo":
 	for i in computation_name_list:
-		check_filename = os.path.join(computation_path,i,i) + ".run"
-		if os.path.isfile(check_filename):
-			print ("\t%s" %(i))
+		if i in project_computations:
+			found = i + ".run" in project_computations[i]["runs"]
+		else:
+			found = os.path.isfile(os.path.join(computation_path,i,i) + ".run")
+		if found:
+			info = project_computations.get(i)
+			if info is None:
+				print ("\t%s" %(i))
+			else:
+				mesh_size, last_result = computation_file_times(computation_path, i, info)
+				if last_result:
+					last_result = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_result))
+				else:
+					last_result = "none"
+				print ("\t%s (mesh files: %.1f MB, steering file: %s, last result: %s)" %(i, mesh_size / 1048576.0, "yes" if info["steering"] else "no", last_result))
 		else:
 			print (">: The computation %s does not exist" %(i))
 			print (">: Skipping computation %s" %(i))
 else:
 	for i in computation_name_list:
-		check_filename = os.path.join(computation_path,i)
-		if os.path.isfile(check_filename):
+		if i in project_files or os.path.isfile(os.path.join(computation_path,i)):
 			print ("\t%s" %(i))
 		else:
 			print (">: The computation %s does not exist" %(i))
@@ -654,12 +916,15 @@ if software != "hh":
 
 print (">: The number of cores is: %s" %nCores)
 
+if array_job:
+	print (">: The computations will be submitted as one array job")
+
 if software == "ft":
-    launch_fine_turbo(computation_path, computation_name_list, mpi, version, nCores, memFT, parpar, software, submit)
+	launch_fine_turbo(computation_path, computation_name_list, mpi, version, nCores, memFT, parpar, software, submit, array_job, max_running)
 elif software == "fo":
-    launch_fine_open(computation_path, computation_name_list, mpi, version, nCores, software, submit)
+	launch_fine_open(computation_path, computation_name_list, mpi, version, nCores, software, submit, array_job, max_running)
 elif software == "hh":
-	launch_hexpress_hybrid(computation_path, computation_name_list, version, nCores, software, submit)
+	launch_hexpress_hybrid(computation_path, computation_name_list, version, nCores, software, submit, array_job=array_job, max_running=max_running)
 
 # Delete all SGE scripts
 # if delete == "y":